@@ -1,38 +1,112 @@
 # https://sagi-shavuot.streamlit.app/
 
 import streamlit as st
-import speech_recognition as sr
 import os
 from dotenv import load_dotenv
-from utils.pollinations_generator import PollinationsGenerator
-from utils.together_ai_generator import TogetherAIGenerator
-from utils.telegram_sender import TelegramSender
 import base64
-from PIL import Image, ImageDraw, ImageFont
+import hashlib
+from PIL import Image, ImageDraw
 import io
-import requests
-import arabic_reshaper
-from bidi.algorithm import get_display
-import textwrap
-from utils.imgur_uploader import ImgurUploader
+from utils.outbox import Outbox
+from utils.pipeline import StageGroup, StageFailed, StageTimeout
+from utils.basket_cache import BasketCache, basket_key
+from utils.single_flight import SingleFlight
+from utils.blessing_bank import BlessingBank, stream_with_fallback
+from utils.user_registry import UserRegistry
+from utils.hyperloglog import HyperLogLogCounter
+from utils.renditions import Renditions
+from utils.photo_ingest import prepare_photo
+from utils.photo_overlay import overlay_photo
+from utils.text_layout import load_font, render_text_block, BLESSING_FONTS, TIPS_FONTS
+from utils.tracing import span, request_context, METRICS, start_metrics_server
+from utils import http_client
 import uuid
 import json
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
 
 # Load environment variables
 load_dotenv()
 
-# Load examples from JSON
-with open("examples.json", encoding="utf-8") as f:
-    EXAMPLES = json.load(f)
+@st.cache_data
+def load_json(path):
+    """Static JSON assets, read from disk once per process"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+@st.cache_data
+def load_styles(path="static/styles.css"):
+    """All of the app's CSS, read from disk once per process"""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+# Per-stage time limits (seconds) for the concurrent basket pipeline
+TEXT_STAGE_TIMEOUT = 60
+IMAGE_STAGE_TIMEOUT = 120
+# Whole-basket latency budget; every upstream call's timeout is cut to what is left of it
+BASKET_BUDGET = float(os.getenv("BASKET_BUDGET", str(IMAGE_STAGE_TIMEOUT)))
+# Seconds to wait for the LLM's first token before using the blessing bank
+BLESSING_BUDGET = float(os.getenv("BLESSING_BUDGET", "4"))
+# Share-link polls, 2 seconds apart, before the link is given up on
+SHARE_POLL_LIMIT = 15
+
+# Most images one basket may ask for at once; each one takes an upstream slot
+MAX_VARIANTS = 4
+# Show a low-resolution turbo draft while the flux image is generated
+PROGRESSIVE_PREVIEW = os.getenv("PROGRESSIVE_PREVIEW", "1") != "0"
+DRAFT_SIZE = (512, 512)
+# Pollinations' default output size; drafts are scaled up to it, so the final image replaces them in place
+FINAL_SIZE = (1024, 1024)
+
+# Bump when compose_final_image output changes, so cached baskets are re-rendered
+LAYOUT_VERSION = 2
+
+# Generators and delivery clients are created on first use, not at import:
+# their SDKs (together, aiohttp, requests, deep_translator) dominate cold
+# start, and the first page paint needs none of them.
+# See benchmarks/import_budget.py. Getters that may first be called from a
+# pipeline or outbox thread don't show the cache spinner, which needs the
+# script thread.
+@st.cache_resource(show_spinner=False)
+def get_pollinations():
+    from utils.pollinations_generator import PollinationsGenerator
+    return PollinationsGenerator()
+
+@st.cache_resource(show_spinner=False)
+def get_together_ai():
+    from utils.together_ai_generator import TogetherAIGenerator
+    return TogetherAIGenerator(timeout=TEXT_STAGE_TIMEOUT)
+
+@st.cache_resource(show_spinner=False)
+def get_telegram_dispatcher():
+    # Raises if the Telegram environment variables are missing; the outbox
+    # then keeps the job and retries, instead of the whole app failing to start
+    from utils.telegram_dispatcher import TelegramDispatcher
+    dispatcher = TelegramDispatcher().start()
+    METRICS.register_collector("telegram", dispatcher.metrics)
+    return dispatcher
+
+@st.cache_resource
+def get_metrics_server():
+    """Prometheus endpoint at http://127.0.0.1:9464/metrics; METRICS_PORT=0 turns it off"""
+    port = int(os.getenv("METRICS_PORT", "9464"))
+    METRICS.register_collector("single_flight", get_basket_flight().stats)
+    METRICS.register_collector("http", http_client.stats)
+    if not port:
+        return None
+    return start_metrics_server(os.getenv("METRICS_HOST", "127.0.0.1"), port)
+
+@st.cache_resource
+def get_basket_cache():
+    return BasketCache()
 
-# Load item ideas from JSON
-with open("item_ideas.json", encoding="utf-8") as f:
-    ITEM_IDEAS = json.load(f)
+@st.cache_resource
+def get_blessing_bank():
+    return BlessingBank()
 
-# Initialize generators
-pollinations = PollinationsGenerator()
-together_ai = TogetherAIGenerator()
-telegram = TelegramSender()
+@st.cache_resource
+def get_basket_flight():
+    return SingleFlight()
 
 def get_user_id():
     if 'user_id' not in st.session_state:
@@ -40,79 +114,57 @@ def get_user_id():
         st.session_state['user_id'] = user_id
     return st.session_state['user_id']
 
-def register_user(user_id, users_file='users.txt'):
-    if not os.path.exists(users_file):
-        with open(users_file, 'w') as f:
-            f.write('')
-    with open(users_file, 'r+') as f:
-        users = set(line.strip() for line in f)
-        if user_id not in users:
-            f.write(user_id + '\n')
-            users.add(user_id)
-    return len(users)
-
-def compose_final_image(image_url, hebrew_text):
-    """Compose a new image: top - blessing (wrapped), middle - basket, bottom center - tips text"""
+@st.cache_resource
+def get_user_registry():
+    # "hll" counts approximately in constant memory; "exact" keeps every user id
+    if os.getenv("USER_COUNTER_BACKEND", "exact") == "hll":
+        return HyperLogLogCounter(
+            os.getenv("USER_COUNTER_SKETCH", "users.hll"),
+            error_rate=float(os.getenv("USER_COUNTER_ERROR", "0.01")),
+            peer_paths=os.getenv("USER_COUNTER_PEERS", "").split(","),
+        )
+    return UserRegistry()
+
+def register_user(user_id):
+    return get_user_registry().register(user_id)
+
+def overlay_user_photo(canvas, user_image):
+    """Paste the personal photo, with rounded corners and shadow, at the bottom right of the canvas"""
+    # Remove polaroid frame: just use the user image with rounded corners and shadow
+    img_w = canvas.width // 5 - 24
+    img_h = int(img_w * 0.8)
+    # Decoded straight to thumbnail size
+    user_img = prepare_photo(user_image.getvalue(), (img_w, img_h))
+    # New position: bottom right
+    frame_x = canvas.width-img_w-40
+    frame_y = canvas.height-img_h-40
+    overlay_photo(canvas, user_img, (frame_x, frame_y))
+
+def compose_final_image(basket_bytes, hebrew_text, user_image=None, size=None):
+    """Compose a new image: top - blessing (wrapped), middle - basket, bottom center - tips text,
+    and the optional personal photo - all on one in-memory canvas, returned unencoded.
+    `size` scales the basket image first, e.g. a draft up to the final image's size"""
+    with span("compose", photo=user_image is not None) as stage:
+        return _compose_final_image(stage, basket_bytes, hebrew_text, user_image, size)
+
+def _compose_final_image(stage, basket_bytes, hebrew_text, user_image, size=None):
     try:
-        # Download the basket image
-        response = requests.get(image_url)
-        basket_img = Image.open(io.BytesIO(response.content)).convert("RGB")
+        # Decode the basket image already fetched by the generator
+        basket_img = Image.open(io.BytesIO(basket_bytes)).convert("RGB")
+        if size and basket_img.size != size:
+            basket_img = basket_img.resize(size, Image.BICUBIC)
         basket_width, basket_height = basket_img.size
 
-        # Set up fonts
-        try:
-            font_bless = ImageFont.truetype("NotoSansHebrew-Regular.ttf", 40)
-        except:
-            try:
-                font_bless = ImageFont.truetype("arial.ttf", 40)
-            except:
-                font_bless = ImageFont.load_default()
-        try:
-            font_tips = ImageFont.truetype("arial.ttf", 10)
-        except:
-            font_tips = ImageFont.load_default()
-
-        # --- RTL Hebrew fix ---
-        reshaped_text = arabic_reshaper.reshape(hebrew_text)
-        bidi_text = get_display(reshaped_text)
-
-        # Helper to get text size (bbox or size)
-        def get_text_size(draw, text, font):
-            if hasattr(draw, 'textbbox'):
-                bbox = draw.textbbox((0,0), text, font=font)
-                width = bbox[2] - bbox[0]
-                height = bbox[3] - bbox[1]
-                return width, height
-            else:
-                return draw.textsize(text, font=font)
-
-        # --- Word wrap blessing text ---
-        dummy_img = Image.new("RGB", (basket_width, 100), "white")
-        draw_dummy = ImageDraw.Draw(dummy_img)
-        max_width = basket_width - 40  # 20px padding each side
-        # Split text into lines that fit
-        words = bidi_text.split()
-        lines = []
-        current_line = ""
-        for word in words:
-            test_line = (word if not current_line else current_line + " " + word)
-            w, h = get_text_size(draw_dummy, test_line, font_bless)
-            if w <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                current_line = word
-        if current_line:
-            lines.append(current_line)
-        # Reverse lines for correct Hebrew (RTL) order
-        lines = lines[::-1]
-        bless_h = h * len(lines) + 10 * (len(lines)-1)
+        # Fonts and the wrapped blessing tile are cached across requests
+        font_bless = load_font(BLESSING_FONTS, 40)
+        font_tips = load_font(TIPS_FONTS, 10)
+        bless_tile, bless_h = render_text_block(hebrew_text, font_bless, basket_width)
         bless_pad = 30
 
         # Tips text
         tips_text = "AI TIPS & TRICKS with sagi bar on"
-        tips_w, tips_h = get_text_size(draw_dummy, tips_text, font_tips)
+        tips_left, tips_top, tips_right, tips_bottom = font_tips.getbbox(tips_text)
+        tips_h = tips_bottom - tips_top
         tips_pad = 10
         tips_area_h = tips_h + 2 * tips_pad
 
@@ -122,12 +174,7 @@ def compose_final_image(image_url, hebrew_text):
         draw = ImageDraw.Draw(final_img)
 
         # Draw blessing (centered, top, RTL, wrapped)
-        bless_y = bless_pad // 2
-        for line in lines:
-            w, h = get_text_size(draw, line, font=font_bless)
-            bless_x = basket_width // 2
-            draw.text((bless_x, bless_y), line, fill="black", font=font_bless, anchor="ma")
-            bless_y += h + 10
+        final_img.paste(bless_tile, (0, bless_pad // 2), bless_tile)
 
         # Paste basket image
         final_img.paste(basket_img, (0, bless_h + bless_pad))
@@ -137,23 +184,394 @@ def compose_final_image(image_url, hebrew_text):
         tips_y = final_height - tips_area_h + tips_pad // 2
         draw.text((tips_x, tips_y), tips_text, fill="gray", font=font_tips, anchor="ma")
 
-        # Convert to bytes
-        img_byte_arr = io.BytesIO()
-        final_img.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        return img_byte_arr
+        # שילוב תמונה אישית אם הועלתה
+        if user_image is not None:
+            try:
+                overlay_user_photo(final_img, user_image)
+            except Exception as e:
+                stage.fail(e, outcome="partial")
+                st.error(f"שגיאה בשילוב התמונה האישית: {str(e)}")
+        return final_img
     except Exception as e:
+        stage.fail(e)
         st.error(f"שגיאה בהרכבת התמונה: {str(e)}")
         return None
 
-def get_image_download_link(img_bytes, filename="bikkurim_basket.png"):
+# stage -> (progress at start, progress at end, label)
+PROGRESS_STAGES = {
+    "translate": (0, 10, "🌐 מתרגם את הפריטים..."),
+    "generate": (10, 60, "🎨 יוצר תמונה של הסל שלך..."),
+    "download": (60, 85, "⬇️ מוריד את התמונה..."),
+    "compose": (85, 99, "🧩 מרכיב את התמונה..."),
+}
+
+def progress_reporter(progress_bar):
+    """Callback(stage, fraction) that moves the progress bar with the real pipeline stages"""
+    def report(stage, fraction=None):
+        start, end, label = PROGRESS_STAGES[stage]
+        if fraction is None:
+            percent = start
+        else:
+            percent = int(start + (end - start) * fraction)
+            label = f"{label} {int(fraction * 100)}%"
+        progress_bar.progress(percent, text=label)
+    return report
+
+def write_blessing(user_items, slot=None, cancel_event=None, timeout=None):
+    """Stream the blessing into `slot` (a new one by default) and leave it there in its
+    styled box; if the LLM misses its budget the local bank answers instantly.
+    Stops where it is once `cancel_event` is set or `timeout` seconds pass.
+    Returns (blessing or an empty string, whether it is the bank's stand-in)"""
+    bank = get_blessing_bank()
+    fallback_text = bank.lookup(user_items)
+    # Created here, on the script thread: the cached getter's first call shows a
+    # spinner, which fails on the stream's background thread
+    together_ai = get_together_ai()
+    sources = []
+    blessing_stream = stream_with_fallback(
+        lambda: together_ai.stream_hebrew_text(user_items),
+        fallback=fallback_text,
+        budget=BLESSING_BUDGET,
+        on_complete=lambda text: bank.learn(user_items, text),
+        on_source=sources.append,
+        cancel_event=cancel_event,
+        timeout=timeout,
+    )
+    text_slot = slot if slot is not None else st.empty()
+    with span("blessing", budget_s=BLESSING_BUDGET) as blessing_span:
+        with text_slot.container():
+            hebrew_text = st.write_stream(blessing_stream)
+        if isinstance(hebrew_text, list):
+            hebrew_text = "".join(str(part) for part in hebrew_text)
+        hebrew_text = (hebrew_text or "").strip()
+        from_bank = sources == ["bank"]
+        blessing_span.set(source="bank" if from_bank else "llm")
+        if not hebrew_text:
+            blessing_span.fail("empty blessing")
+            text_slot.empty()
+            return hebrew_text, from_bank
+        # Same place, so the first content stays up for the whole image wait
+        with text_slot.container():
+            show_blessing(hebrew_text)
+    return hebrew_text, from_bank
+
+def show_blessing(hebrew_text):
+    st.markdown(f"<div class='wow-box' style='border-color:#d72660;'><b>📝</b> {hebrew_text}</div>", unsafe_allow_html=True)
+
+def show_preview(container, renditions, caption):
+    try:
+        container.image(renditions.get("preview"), caption=caption, use_container_width=True)
+    except TypeError:
+        container.image(renditions.get("preview"), caption=caption, width=600)
+
+def show_draft(preview, draft, final, hebrew_text, user_image=None):
+    """Compose the turbo draft with the blessing and show it in `preview`,
+    unless the final image is ready first or the draft fails"""
+    with span("draft") as stage:
+        wait([draft, final], timeout=IMAGE_STAGE_TIMEOUT, return_when=FIRST_COMPLETED)
+        stage.set(shown=False)
+        if final.done() or not draft.done() or draft.result() is None:
+            return
+        draft_img = compose_final_image(draft.result()[1], hebrew_text, user_image, size=FINAL_SIZE)
+        if draft_img is None:
+            return
+        with preview.container():
+            show_blessing(hebrew_text)
+            show_preview(st, Renditions(draft_img), "✏️ טיוטה מהירה - התמונה הסופית בדרך...")
+        stage.set(shown=True)
+
+def produce_basket(user_items, cache_key, compose=True, model=None, preview=None, user_image=None):
+    """Generate blessing and basket image concurrently and cache them, with the
+    composed image too when `compose` is set. Given a `preview` slot, a quick
+    turbo draft is composed and shown there first; it is never cached.
+    A blessing from the bank is a stand-in, so only the image is cached then"""
+    # Another session may have finished this basket while we waited to lead
+    cached = get_basket_cache().get(cache_key)
+    if cached and cached["blessing"]:
+        return cached
+    # An image cached with a stand-in blessing: only the blessing is asked for again
+    cached_image = cached["basket"] if cached else None
+
+    # 1+2. טקסט שירי ותמונה - במקביל, ממתינים רק לאיטי מביניהם
+    progress_bar = st.progress(0, text="🎨 יוצר תמונה של הסל שלך...")
+    report_progress = progress_reporter(progress_bar)
+    stages = StageGroup()
+    if cached_image is None:
+        final = stages.submit("image", generate_image, user_items, progress=report_progress,
+                              cancel_event=stages.cancel_event, model=model, timeout=IMAGE_STAGE_TIMEOUT)
+    else:
+        final = stages.submit("image", lambda: (None, cached_image), timeout=IMAGE_STAGE_TIMEOUT)
+    # Runs alongside the final image; stopped once that is ready
+    draft_cancel = threading.Event()
+    draft = None
+    if cached_image is None and preview is not None and PROGRESSIVE_PREVIEW and model != "turbo":
+        draft = get_pollinations().generate_draft(user_items, size=DRAFT_SIZE, cancel_event=draft_cancel)
+
+    results = None
+    try:
+        # The blessing streams in on this thread while the image is generated,
+        # into the slot the draft and then the final image take over. It is the
+        # text stage: abandoned as soon as the image stage fails, and time-boxed
+        hebrew_text, from_bank = write_blessing(user_items, slot=preview, cancel_event=stages.cancel_event,
+                                                timeout=TEXT_STAGE_TIMEOUT)
+        if stages.cancel_event.is_set():
+            results = stages.join()  # raises the image stage's failure
+        if not hebrew_text:
+            return None
+        if draft is not None:
+            show_draft(preview, draft, final, hebrew_text, user_image)
+        results = stages.join()
+    except StageTimeout:
+        st.error("יצירת הסל ארכה יותר מדי זמן, נסו שוב")
+        return None
+    except StageFailed as e:
+        print(f"Basket stage failed: {str(e)}")
+        return None
+    finally:
+        draft_cancel.set()
+        # Also on a rerun or stop mid-stream, so the image stage frees its upstream slot
+        if results is None:
+            stages.cancel()
+    image_url, basket_bytes = results["image"]
+    basket = {"basket": basket_bytes, "blessing": hebrew_text, "final": None, "renditions": None,
+              "from_bank": from_bank}
+    if compose:
+        # Add text to image; kept in memory, the PNG master is cached once the preview is up
+        report_progress("compose")
+        final_img = compose_final_image(basket_bytes, hebrew_text)
+        if final_img is None:
+            return None
+        basket["renditions"] = Renditions(final_img)
+    # The next request for this basket asks the LLM again instead of serving the stand-in
+    get_basket_cache().put(cache_key, basket_bytes, None if from_bank else hebrew_text)
+    progress_bar.progress(100, text="✅ התמונה מוכנה!")
+    return basket
+
+def store_final(renditions, cache_key):
+    """Cache the PNG master of a fresh photo-less composition, and from then on its
+    renditions; called after the preview is shown, so the encode never delays it"""
+    if renditions.cache is not None:
+        return
+    cache = get_basket_cache()
+    cache.put_final(cache_key, renditions.get("download"))
+    renditions.attach_cache(cache, cache_key)
+
+def render_basket(basket, cache_key, user_image=None):
+    """Renditions of the final image: built on the cached or just-made composition
+    when there is no personal photo, otherwise on a single compose pass. A fresh
+    photo-less composition is left to store_final once it has been shown"""
+    if user_image is None and basket.get("renditions"):
+        return basket["renditions"]
+    if user_image is None and basket["final"]:
+        return Renditions(png_bytes=basket["final"], cache=get_basket_cache(), cache_key=cache_key)
+    final_img = compose_final_image(basket["basket"], basket["blessing"], user_image)
+    if final_img is None:
+        return None
+    return Renditions(final_img)
+
+def produce_variants(user_items, count, model, user_image=None):
+    """Generate `count` images of the basket concurrently, one seed each, and show
+    every one as soon as it is composed: the first one ready in the main preview,
+    all of them in a grid below it. Variants already cached are shown at once.
+    Returns (blessing, [(cache_key, number, renditions)] in the order they were
+    ready), or None if no variant could be made"""
+    pollinations = get_pollinations()
+    seeds = [pollinations.seed + i for i in range(count)]
+    keys = {seed: basket_key(user_items, model=model, seed=seed, layout=LAYOUT_VERSION) for seed in seeds}
+    cached = {seed: get_basket_cache().get(key) for seed, key in keys.items()}
+    cached = {seed: basket for seed, basket in cached.items() if basket}
+    # Requested before the blessing, so the images generate while it streams;
+    # set on every way out, a rerun included, so no fetch keeps its upstream slot
+    cancel = threading.Event()
+    generated = pollinations.generate_variants(user_items, [seed for seed in seeds if seed not in cached],
+                                               model=model, cancel_event=cancel)
+    try:
+        return _show_variants(user_items, count, seeds, keys, cached, generated, user_image)
+    finally:
+        cancel.set()
+
+def _show_variants(user_items, count, seeds, keys, cached, generated, user_image):
+    """The page side of produce_variants: the blessing, then each variant as it is ready"""
+    # One blessing for all variants; a cached variant's keeps them consistent.
+    # Images cached with a stand-in blessing have none, and ask the LLM again
+    blessed = [basket["blessing"] for basket in cached.values() if basket["blessing"]]
+    from_bank = False
+    if blessed:
+        hebrew_text = blessed[0]
+        show_blessing(hebrew_text)
+    else:
+        hebrew_text, from_bank = write_blessing(user_items)
+    if not hebrew_text:
+        return None
+    # A stand-in blessing is never cached; only the images are
+    cached_blessing = None if from_bank else hebrew_text
+
+    progress_bar = st.progress(0, text=f"🎨 יוצר {count} גרסאות של הסל שלך...")
+    main_slot = st.empty()
+    columns = st.columns(count)
+    slots = {seed: columns[i].empty() for i, seed in enumerate(seeds)}
+    for i, seed in enumerate(seeds):
+        slots[seed].caption(f"⏳ גרסה {i + 1}...")
+    ready = []
+
+    def show(seed, basket):
+        renditions = render_basket(basket, keys[seed], user_image)
+        if renditions is None:
+            return
+        number = seeds.index(seed) + 1
+        show_preview(slots[seed], renditions, f"גרסה {number}")
+        if not ready:
+            show_preview(main_slot, renditions, "הסל שלך לביכורים")
+        ready.append((keys[seed], number, renditions))
+        progress_bar.progress(int(100 * len(ready) / count), text=f"🎨 {len(ready)} מתוך {count} גרסאות מוכנות...")
+
+    for seed, basket in cached.items():
+        if not basket["blessing"]:
+            basket = {"basket": basket["basket"], "blessing": hebrew_text, "final": None}
+            if cached_blessing:
+                get_basket_cache().put(keys[seed], basket["basket"], cached_blessing)
+        show(seed, basket)
+    for seed, image_url, image_bytes in generated:
+        if image_bytes is None:
+            slots[seed].caption(f"⚠️ גרסה {seeds.index(seed) + 1} נכשלה")
+            continue
+        basket = {"basket": image_bytes, "blessing": hebrew_text, "final": None}
+        # The composition is added by store_final once shown, unless it has a personal photo
+        get_basket_cache().put(keys[seed], image_bytes, cached_blessing)
+        show(seed, basket)
+
+    if not ready:
+        progress_bar.empty()
+        st.error("לא הצלחנו ליצור את הסל, נסו שוב")
+        return None
+    progress_bar.progress(100, text="✅ התמונות מוכנות!")
+    if user_image is None and cached_blessing:
+        for key, _, renditions in ready:
+            store_final(renditions, key)
+    return hebrew_text, ready
+
+@st.cache_resource
+def get_outbox():
+    # Workers run the Imgur uploads; Telegram jobs only hand their photo to
+    # the rate-limited dispatcher and complete from its future, so a Telegram
+    # backlog never holds a worker the share links wait on
+    outbox = Outbox(workers=8)
+
+    def send_telegram_photo(payload, photo_bytes):
+        # Fails if the dispatcher drops the photo, and the outbox retries later
+        return get_telegram_dispatcher().submit(photo_bytes, caption=payload["caption"],
+                                                filename=payload["filename"], content_type=payload["mime_type"])
+
+    def upload_to_imgur(payload, image_bytes):
+        from utils.imgur_uploader import get_imgur_uploader, IMGUR_FALLBACK_URL
+        imgur_url = get_imgur_uploader().upload_bytes(image_bytes, "image", payload["title"], payload["description"])
+        if not imgur_url or imgur_url == IMGUR_FALLBACK_URL:
+            raise RuntimeError("Imgur upload failed")
+        return imgur_url
+
+    outbox.register("telegram_photo", send_telegram_photo)
+    outbox.register("imgur_upload", upload_to_imgur)
+    outbox.start()
+    return outbox
+
+def share_links(imgur_job):
+    """Download and WhatsApp links, shown once the background Imgur upload is done.
+    A fragment that reruns every 2 seconds only while the link is still waited for"""
+    st.fragment(run_every=2 if share_outcome(imgur_job) is None else None)(_share_links)(imgur_job)
+
+def share_outcome(imgur_job, polls=0):
+    """The share link's Imgur URL, "" once it is unavailable, or None while it is still
+    waited for. The user is not kept waiting through the outbox retries: the link is
+    given up on after its first failed attempt or SHARE_POLL_LIMIT polls. Settled
+    outcomes are kept in the session, so later polls never touch the outbox"""
+    settled = st.session_state.setdefault("share_outcomes", {})
+    if imgur_job in settled:
+        return settled[imgur_job]
+    outbox = get_outbox()
+    job = outbox.result(imgur_job)
+    if job is not None:
+        outcome = job["result"] if job["status"] == "done" else ""
+    elif outbox.failed_attempts(imgur_job) or polls >= SHARE_POLL_LIMIT:
+        outcome = ""
+    else:
+        return None
+    settled[imgur_job] = outcome
+    return outcome
+
+def _share_links(imgur_job):
+    polls = st.session_state.setdefault("share_polls", {})
+    polls[imgur_job] = polls.get(imgur_job, 0) + 1
+    imgur_url = share_outcome(imgur_job, polls[imgur_job])
+    if imgur_url is None:
+        st.caption("⏳ מכין קישור לשיתוף...")
+        return
+    if not imgur_url:
+        st.error("הקישור לשיתוף לא זמין כרגע")
+        return
+
+    # תקן את הלינק ל-imgur.com
+    if imgur_url.startswith("https://i.imgur.com/"):
+        img_id = imgur_url.replace("https://i.imgur.com/", "").split(".")[0]
+        img_id = ''.join([c for c in img_id if c.isalnum()])
+        imgur_url = f"https://imgur.com/{img_id}"
+
+    st.markdown(f'<a href="{imgur_url}" download class="download-btn">⬇️ הורדת התמונה</a>', unsafe_allow_html=True)
+    share_text = f"{imgur_url}"
+    whatsapp_url = f"https://wa.me/?text={share_text}"
+    st.markdown(f'<a href="{whatsapp_url}" target="_blank" style="font-size:1.3em; color:#25d366;">📱 שיתוף בוואטסאפ</a>', unsafe_allow_html=True)
+
+def deliver_basket(renditions, user_items, hebrew_text):
+    """Send the basket to the Telegram group and start its Imgur upload; both run
+    in the background outbox and never delay the page. Returns the Imgur job id"""
+    get_outbox().enqueue(
+        "telegram_photo",
+        {
+            "caption": f"סל ביכורים חדש: {user_items}\n{hebrew_text}",
+            "filename": renditions.filename("telegram"),
+            "mime_type": renditions.mime_type("telegram"),
+        },
+        renditions.get("telegram"),
+    )
+    return enqueue_share(renditions)
+
+def enqueue_share(renditions):
+    """Upload the share rendition to Imgur in the background; returns the outbox job id"""
+    return get_outbox().enqueue(
+        "imgur_upload",
+        {"title": "Bikkurim Basket", "description": "AI Generated Bikkurim Basket"},
+        renditions.get("share"),
+    )
+
+@st.fragment
+def variant_picker(variants, first_job, photo_digest=None):
+    """Choose the variant the share links point to; each choice is uploaded to Imgur once.
+    Uploads are remembered per basket (its first job) and keyed by variant and personal photo"""
+    shares = st.session_state.get("variant_share_jobs")
+    if shares is None or shares["basket"] != first_job:
+        # A new basket: the previous one's uploads must never be linked from it
+        shares = st.session_state["variant_share_jobs"] = {"basket": first_job, "jobs": {}}
+    jobs = shares["jobs"]
+    first_key, first_number, _ = variants[0]
+    jobs.setdefault((first_key, photo_digest), first_job)
+    numbers = sorted(number for _, number, _ in variants)
+    keys = {number: key for key, number, _ in variants}
+    number = st.radio("איזו גרסה לשתף?", numbers, index=numbers.index(first_number),
+                      format_func=lambda n: f"גרסה {n}", horizontal=True)
+    key = keys[number]
+    if (key, photo_digest) not in jobs:
+        renditions = next(r for k, _, r in variants if k == key)
+        jobs[key, photo_digest] = enqueue_share(renditions)
+    share_links(jobs[key, photo_digest])
+
+def get_image_download_link(renditions, rendition="download"):
     """Generate a download link for the image"""
-    b64 = base64.b64encode(img_bytes).decode()
-    href = f'<a href="data:image/png;base64,{b64}" download="{filename}" class="download-btn">⬇️ הורד את התמונה</a>'
+    b64 = base64.b64encode(renditions.get(rendition)).decode()
+    href = f'<a href="data:{renditions.mime_type(rendition)};base64,{b64}" download="{renditions.filename(rendition)}" class="download-btn">⬇️ הורד את התמונה</a>'
     return href
 
 def transcribe_audio():
     """Record and transcribe audio using speech_recognition"""
+    import speech_recognition as sr
     r = sr.Recognizer()
     with sr.Microphone() as source:
         st.info("🎤 הקלטה מתחילה...")
@@ -170,218 +588,35 @@ def transcribe_audio():
         st.error("שגיאה בשירות ההקלטה")
         return None
 
-def generate_image(prompt):
-    # פרומפט עשיר ומפורט
-    basket_prompt = (
-        f"A beautiful Shavuot basket on a festive table, containing: {prompt}. "
-        "The basket is overflowing with fresh, colorful produce, cheeses, and flowers. "
-        "Ultra-realistic, vibrant, joyful, high detail, 4k, cinematic lighting."
-    )
-    return pollinations.generate_image(basket_prompt)
+def generate_image(prompt, progress=None, cancel_event=None, model=None):
+    # The generator builds the full basket prompt itself; it needs the bare
+    # comma-separated items so each one hits the translation cache.
+    return get_pollinations().generate_image(prompt, progress=progress, cancel_event=cancel_event, model=model)
 
 def generate_hebrew_text(prompt):
     """Generate Hebrew text using Together AI"""
-    return together_ai.generate_hebrew_text(prompt)
-
-
-def hide_streamlit_header_footer():
-    hide_st_style = """
-    <style>
-        #MainMenu {visibility: hidden;}
-        footer {visibility: hidden;}
-        header {visibility: hidden;}
-        #root > div:nth-child(1) > div > div > div > div > section > div {padding-top: 0rem;}
-    </style>
-    """
-    st.markdown(hide_st_style, unsafe_allow_html=True)
-
-def main():    
-    st.set_page_config(
-        page_title="מה תביאו לביכורים? 🎉",
-        page_icon="🎉",
-        layout="centered"
-    )
-
-    hide_streamlit_header_footer()     
-
-    # ספירת משתמשים ייחודיים
-    user_id = get_user_id() 
+    return get_together_ai().generate_hebrew_text(prompt)
 
-    total_users = register_user(user_id)
-    st.markdown(f'<div style="text-align:center;font-size:1.3em;margin:10px 0 0 0;"><b>סה"כ משתמשים: {total_users}</b></div>', unsafe_allow_html=True)
 
-    # עיצוב וואו + RTL
-    st.markdown("""
-        <style>
-        @import url('https://fonts.googleapis.com/css2?family=Varela+Round&display=swap');
-        .stApp { 
-            direction: rtl; 
-            background: linear-gradient(135deg, #fffbe7 0%, #ffe5ec 100%); 
-            font-family: 'Varela Round', sans-serif; 
-        }
-        .wow-box { 
-            border-radius: 24px; 
-            box-shadow: 0 4px 32px #ffb6b6; 
-            border: 3px solid #ffb6b6; 
-            padding: 24px; 
-            background: #fff8;
-            animation: fadeIn 0.5s ease-in;
-        }
-        .example-btn { 
-            background: #fffbe7; 
-            border: 2px solid #ffb6b6; 
-            border-radius: 16px; 
-            margin: 4px; 
-            font-size: 1.1em; 
-            transition: 0.2s; 
-        }
-        .example-btn:hover { 
-            background: #ffe5ec; 
-            color: #d72660; 
-            transform: scale(1.05);
-        }
-        .result-img { 
-            border-radius: 18px; 
-            box-shadow: 0 2px 16px #d7266060; 
-            border: 2px solid #d72660;
-            animation: slideUp 0.5s ease-out;
-        }
-        .download-btn {
-            display: inline-block;
-            padding: 10px 20px;
-            background: linear-gradient(135deg, #4fc3f7 0%, #1976d2 100%);
-            color: white;
-            text-decoration: none;
-            border-radius: 12px;
-            margin: 10px 0;
-            transition: 0.3s;
-            animation: pulse 2s infinite;
-        }
-        .download-btn:hover {
-            transform: scale(1.05);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.2);
-        }
-        @keyframes fadeIn {
-            from { opacity: 0; }
-            to { opacity: 1; }
-        }
-        @keyframes slideUp {
-            from { transform: translateY(20px); opacity: 0; }
-            to { transform: translateY(0); opacity: 1; }
-        }
-        @keyframes pulse {
-            0% { transform: scale(1); }
-            50% { transform: scale(1.05); }
-            100% { transform: scale(1); }
-        }
-        .input-box { 
-            width: 100%; 
-            border-radius: 12px; 
-            border: 2px solid #ffb6b6; 
-            padding: 10px; 
-            font-size: 1.1em; 
-            margin-bottom: 10px; 
-            direction: rtl;
-            transition: 0.3s;
-        }
-        .input-box:focus {
-            border-color: #d72660;
-            box-shadow: 0 0 8px #d7266060;
-        }
-        .sticky-footer {
-          position: fixed;
-          bottom: 0;
-          left: 0;
-          width: 100vw;
-          background: #fff;
-          z-index: 999;
-          border-top: 2px solid #eee;
-          box-shadow: 0 -2px 12px #0001;
-          padding: 8px 0 2px 0;
-        }
-        .big-create-btn {
-            width: 100% !important;
-            display: block;
-            background: linear-gradient(90deg, #ff5e62 0%, #ff9966 100%);
-            color: white !important;
-            font-size: 1.5em !important;
-            font-weight: bold !important;
-            border: none;
-            border-radius: 16px;
-            padding: 22px 0 22px 0;
-            margin: 18px 0 0 0;
-            box-shadow: 0 4px 24px #ff5e6240;
-            transition: 0.2s;
-            cursor: pointer;
-            letter-spacing: 1px;
-            text-align: center;
-        }
-        .big-create-btn:hover {
-            background: linear-gradient(90deg, #ff9966 0%, #ff5e62 100%);
-            box-shadow: 0 8px 32px #ff5e6280;
-            transform: scale(1.03);
-        }
-        .full-width-basket-btn {
-            width: 100%;
-            display: block;
-            background: linear-gradient(90deg, #ff512f 0%, #dd2476 100%);
-            color: #fff !important;
-            font-size: 2em;
-            font-weight: bold;
-            border: none;
-            border-radius: 18px;
-            padding: 28px 0 28px 0;
-            margin: 22px 0 0 0;
-            box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset;
-            transition: 0.18s;
-            cursor: pointer;
-            letter-spacing: 1.5px;
-            text-align: center;
-            outline: none;
-            animation: pulseBtn 2s infinite;
-        }
-        .full-width-basket-btn:hover {
-            background: linear-gradient(90deg, #dd2476 0%, #ff512f 100%);
-            box-shadow: 0 12px 40px #ff512f99, 0 1.5px 0 #fff inset;
-            transform: scale(1.025);
-        }
-        @keyframes pulseBtn {
-            0% { box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset; }
-            50% { box-shadow: 0 12px 48px #ff512faa, 0 1.5px 0 #fff inset; }
-            100% { box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset; }
-        }
-        .hidden-st-btn { display: none !important; }
-        </style>
-    """, unsafe_allow_html=True)
+def inject_styles():
+    """All static CSS in a single element, so a rerun re-sends one message instead of several"""
+    st.markdown(f"<style>{load_styles()}</style>", unsafe_allow_html=True)
 
-    st.markdown("<h1 style='text-align:center; color:#d72660; font-size:2.5em;'>מה תביא לביכורים? <span style='font-size:1.2em;'>🎉</span></h1>", unsafe_allow_html=True)
-    st.markdown("<div style='text-align:center; font-size:1.2em;'>ספרו לנו מה תרצו להביא לסל הביכורים שלכם</div>", unsafe_allow_html=True)
+@st.fragment
+def basket_editor():
+    """Example buttons, the icon grid and the items text box.
 
-    # עיצוב בולט לתיבת הטקסט
-    st.markdown("""
-    <style>
-    .stTextInput > div > div > input {
-        border: 3px solid #ff5e62 !important;
-        background: #fff !important;
-        font-size: 1.5em !important;
-        font-weight: bold;
-        color: #222 !important;
-        border-radius: 0 !important;
-        padding: 18px 18px !important;
-        box-shadow: 0 4px 24px #ff5e6240;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-    # שלב 1: העלאת תמונה אישית
-    user_image = st.file_uploader("העלו תמונה אישית (רשות)", type=["jpg", "jpeg", "png"], key="user_image")
-    if user_image is not None:
-        st.image(user_image, caption="התמונה האישית שלך", width=250)
+    Runs as a fragment, so toggling an icon or editing the text reruns only
+    this section; the create button outside it reads the result from
+    st.session_state['items_input'].
+    """
+    examples = load_json("examples.json")
+    item_ideas = load_json("item_ideas.json")
 
     # דוגמאות לבחירה - כפתורים מעל תיבת הטקסט
     st.markdown("<div style='text-align:center; margin-top:18px;'>", unsafe_allow_html=True)
-    cols = st.columns(len(EXAMPLES))
-    for i, example in enumerate(EXAMPLES):
+    cols = st.columns(len(examples))
+    for i, example in enumerate(examples):
         if cols[i].button(example, key=f"ex_{i}"):
             st.session_state["items_input"] = example
     st.markdown("</div>", unsafe_allow_html=True)
@@ -397,7 +632,7 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     icon_cols = st.columns(4)
-    for i, idea in enumerate(ITEM_IDEAS):
+    for i, idea in enumerate(item_ideas):
         col = icon_cols[i % 4]
         is_selected = idea['name'] in st.session_state['basket_items']
         btn_label = f"{idea['emoji']}  {idea['name']}"
@@ -423,129 +658,103 @@ def main():
     # עדכון סל מתוך תיבת הטקסט (אם המשתמש ערך ידנית)
     st.session_state['basket_items'] = [item.strip() for item in user_items.split(',') if item.strip()]
 
+def main():    
+    st.set_page_config(
+        page_title="מה תביאו לביכורים? 🎉",
+        page_icon="🎉",
+        layout="centered"
+    )
+
+    inject_styles()
+    get_metrics_server()
+
+    # ספירת משתמשים ייחודיים - פעם אחת לכל session, לא בכל rerun
+    if 'total_users' not in st.session_state:
+        st.session_state['total_users'] = register_user(get_user_id())
+    total_users = st.session_state['total_users']
+    st.markdown(f'<div style="text-align:center;font-size:1.3em;margin:10px 0 0 0;"><b>סה"כ משתמשים: {total_users}</b></div>', unsafe_allow_html=True)
+
+    st.markdown("<h1 style='text-align:center; color:#d72660; font-size:2.5em;'>מה תביא לביכורים? <span style='font-size:1.2em;'>🎉</span></h1>", unsafe_allow_html=True)
+    st.markdown("<div style='text-align:center; font-size:1.2em;'>ספרו לנו מה תרצו להביא לסל הביכורים שלכם</div>", unsafe_allow_html=True)
+
+    # שלב 1: העלאת תמונה אישית
+    user_image = st.file_uploader("העלו תמונה אישית (רשות)", type=["jpg", "jpeg", "png"], key="user_image")
+    if user_image is not None:
+        try:
+            st.image(prepare_photo(user_image.getvalue(), (500, 500), exact=False), caption="התמונה האישית שלך", width=250)
+        except Exception as e:
+            st.error(f"שגיאה בטעינת התמונה האישית: {str(e)}")
+
+    # בחירת פריטים: דוגמאות, אייקונים ותיבת הטקסט רצים כ-fragment
+    basket_editor()
+    user_items = st.session_state.get('items_input', '')
+
+    # כמה גרסאות לתמונה, ובאיזה מודל
+    option_cols = st.columns(2)
+    variant_count = option_cols[0].select_slider("כמה גרסאות לסל?", options=list(range(1, MAX_VARIANTS + 1)), value=1)
+    turbo = option_cols[1].toggle("⚡ מצב מהיר", help="מודל turbo: מהיר יותר, עם פחות פרטים")
+
     # כפתור יצירת סל - עיצוב בולט ורחב (Streamlit button בלבד)
-    st.markdown("""
-    <style>
-    div.stButton > button#basket-create-btn {
-        width: 100% !important;
-        min-width: 300px;
-        max-width: 900px;
-        display: block;
-        background: linear-gradient(90deg, #ff512f 0%, #dd2476 100%);
-        color: #fff !important;
-        font-size: 2em;
-        font-weight: bold;
-        border: none;
-        border-radius: 24px;
-        padding: 28px 0 28px 0;
-        margin: 22px 0 0 0;
-        box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset;
-        transition: 0.18s;
-        cursor: pointer;
-        letter-spacing: 1.5px;
-        text-align: center;
-        outline: none;
-        animation: pulseBtn 2s infinite;
-    }
-    div.stButton > button#basket-create-btn:hover {
-        background: linear-gradient(90deg, #dd2476 0%, #ff512f 100%);
-        box-shadow: 0 12px 40px #ff512f99, 0 1.5px 0 #fff inset;
-        transform: scale(1.025);
-    }
-    @keyframes pulseBtn {
-        0% { box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset; }
-        50% { box-shadow: 0 12px 48px #ff512faa, 0 1.5px 0 #fff inset; }
-        100% { box-shadow: 0 6px 32px #dd247680, 0 1.5px 0 #fff inset; }
-    }
-    </style>
-    """, unsafe_allow_html=True)
     create_basket = st.button("🎨 צרו סל ביכורים", key="basket-create-btn")
 
     if create_basket and user_items:
-        st.markdown(f"<div class='wow-box'><b>🎯 בחרתם:</b> {user_items}</div>", unsafe_allow_html=True)
-
-        # 1. טקסט שירי
-        with st.spinner("📝 יוצר טקסט שירי לסל שלך..."):
-            hebrew_text = generate_hebrew_text(user_items)
-        if hebrew_text:
-            st.markdown(f"<div class='wow-box' style='border-color:#d72660;'><b>📝</b> {hebrew_text}</div>", unsafe_allow_html=True)
-
-            # 2. תמונה עם progress bar
-            progress_bar = st.progress(0, text="🎨 יוצר תמונה של הסל שלך...")
-            import time
-            for percent_complete in range(1, 101, 10):
-                progress_bar.progress(percent_complete, text="🎨 יוצר תמונה של הסל שלך...")
-                time.sleep(0.03)
-            image_url = generate_image(user_items)
-            progress_bar.progress(100, text="✅ התמונה מוכנה!")
-            
-            if image_url:
-                # Add text to image
-                img_with_text = compose_final_image(image_url, hebrew_text)
-                # שילוב תמונה אישית אם הועלתה
-                if img_with_text and user_image is not None:
-                    try:
-                        # Open base image
-                        base_img = Image.open(io.BytesIO(img_with_text)).convert("RGBA")
-                        # Open user image
-                        user_img = Image.open(user_image).convert("RGBA")
-                        # Remove polaroid frame: just use the user image with rounded corners and shadow
-                        img_w = base_img.width // 5 - 24
-                        img_h = int(img_w * 0.8)
-                        user_img = user_img.resize((img_w, img_h))
-                        # Add rounded corners to user image
-                        mask = Image.new("L", (img_w, img_h), 0)
-                        draw_mask = ImageDraw.Draw(mask)
-                        draw_mask.rounded_rectangle([0,0,img_w,img_h], radius=28, fill=255)
-                        user_img.putalpha(mask)
-                        # Add shadow
-                        shadow = Image.new("RGBA", (img_w+12, img_h+12), (0,0,0,0))
-                        shadow_draw = ImageDraw.Draw(shadow)
-                        shadow_draw.rounded_rectangle([6,6,img_w+6,img_h+6], radius=32, fill=(0,0,0,60))
-                        # New position: bottom right
-                        frame_x = base_img.width-img_w-40
-                        frame_y = base_img.height-img_h-40
-                        base_img.paste(shadow, (frame_x+6, frame_y+6), shadow)
-                        base_img.paste(user_img, (frame_x, frame_y), user_img)
-                        # Convert back to bytes
-                        img_byte_arr = io.BytesIO()
-                        base_img = base_img.convert("RGB")
-                        base_img.save(img_byte_arr, format='PNG')
-                        img_with_text = img_byte_arr.getvalue()
-                    except Exception as e:
-                        st.error(f"שגיאה בשילוב התמונה האישית: {str(e)}")
-                if img_with_text:
-                    try:
-                        st.image(img_with_text, caption="הסל שלך לביכורים", use_container_width=True)
-                    except TypeError:
-                        st.image(img_with_text, caption="הסל שלך לביכורים", width=600)
-
-                    # Send to Telegram
-                    try:
-                        telegram.send_photo_bytes(img_with_text, caption=f"סל ביכורים חדש: {user_items}\n{hebrew_text}")
-                    except Exception as e:
-                        print(f"Failed to send to Telegram: {str(e)}")
-
-                # כפתור שיתוף והורדה דרך imgur
-                imgur_url = None
-                try:
-                    uploader = ImgurUploader()
-                    img_b64 = base64.b64encode(img_with_text).decode()
-                    imgur_url = uploader.upload_media_to_imgur(img_b64, "image", "Bikkurim Basket", "AI Generated Bikkurim Basket")
-                except Exception as e:
-                    st.error(f"שגיאה בהעלאת התמונה ל-Imgur: {str(e)}")
-
-                # תקן את הלינק ל-imgur.com
-                if imgur_url and imgur_url.startswith("https://i.imgur.com/"):
-                    img_id = imgur_url.replace("https://i.imgur.com/", "").split(".")[0]
-                    img_id = ''.join([c for c in img_id if c.isalnum()])
-                    imgur_url = f"https://imgur.com/{img_id}"
-
-                if imgur_url:
-                    st.markdown(f'<a href="{imgur_url}" download class="download-btn">⬇️ הורדת התמונה</a>', unsafe_allow_html=True)
-                    share_text = f"{imgur_url}"
-                    whatsapp_url = f"https://wa.me/?text={share_text}"
-                    st.markdown(f'<a href="{whatsapp_url}" target="_blank" style="font-size:1.3em; color:#25d366;">📱 שיתוף בוואטסאפ</a>', unsafe_allow_html=True)
+        # Every span of this basket, here and in background threads, carries the request id
+        with request_context(get_user_id()), http_client.deadline(BASKET_BUDGET), \
+                span("basket", photo=user_image is not None, variants=variant_count) as basket_span:
+            st.markdown(f"<div class='wow-box'><b>🎯 בחרתם:</b> {user_items}</div>", unsafe_allow_html=True)
+
+            pollinations = get_pollinations()
+            model = "turbo" if turbo else pollinations.model
+            if variant_count > 1:
+                # כל הגרסאות נוצרות במקביל, והראשונה שמוכנה מוצגת מיד
+                result = produce_variants(user_items, variant_count, model, user_image)
+                if result:
+                    hebrew_text, variants = result
+                    # The Telegram feed gets the variant that was ready first
+                    imgur_job = deliver_basket(variants[0][2], user_items, hebrew_text)
+                    # The cache key ignores the personal photo, so the share key adds it
+                    photo_digest = hashlib.sha256(user_image.getvalue()).hexdigest() if user_image else None
+                    variant_picker(variants, imgur_job, photo_digest)
+                else:
+                    basket_span.fail("generation failed")
+            else:
+                # סל שכבר נוצר בעבר מוגש מיד מהמטמון
+                cache_key = basket_key(user_items, model=model, seed=pollinations.seed, layout=LAYOUT_VERSION)
+                basket = get_basket_cache().get(cache_key)
+                if basket and not basket["blessing"]:
+                    basket = None  # only the image is cached; produce_basket reuses it
+                basket_span.set(cached=basket is not None)
+                # The blessing and image, first the draft and then the final one, replace each other here
+                preview_slot = st.empty()
+                if basket is None:
+                    # משתמשים שמבקשים את אותו סל בו-זמנית ממתינים ליצירה אחת משותפת
+                    with st.spinner("📝 יוצר טקסט שירי ותמונה לסל שלך..."):
+                        # With a personal photo the shared no-photo composition would
+                        # be encoded for nothing, so leave it to a later request
+                        basket = get_basket_flight().do(cache_key, produce_basket, user_items, cache_key,
+                                                        compose=user_image is None, model=model,
+                                                        preview=preview_slot, user_image=user_image)
+                if basket:
+                    hebrew_text = basket["blessing"]
+
+                    # Composed once; each destination gets its own lazily encoded rendition
+                    renditions = render_basket(basket, cache_key, user_image)
+                    if renditions:
+                        renditions.get("preview")  # encoded before the swap, so the draft stays up meanwhile
+                    with preview_slot.container():
+                        show_blessing(hebrew_text)
+                        if renditions:
+                            show_preview(st, renditions, "הסל שלך לביכורים")
+                    if renditions:
+                        # כפתור שיתוף והורדה דרך imgur - מופיע כשההעלאה מסתיימת
+                        share_links(deliver_basket(renditions, user_items, hebrew_text))
+                        if user_image is None and not basket.get("from_bank"):
+                            store_final(renditions, cache_key)
+                    else:
+                        basket_span.fail("composition failed")
+                else:
+                    preview_slot.empty()
+                    basket_span.fail("generation failed")
 
     # FOOTER with links (sticky to bottom)
     st.markdown("""
@@ -0,0 +1,238 @@
+"""
+End-to-end benchmark of the basket pipeline against local upstream stand-ins.
+
+Runs the app's real code for every basket: translation, image generation
+and the blessing concurrently (as produce_basket does), composition with
+the optional personal-photo overlay, encoding the renditions, and the
+Imgur upload and Telegram delivery the outbox would make. All upstreams
+are served by benchmarks/stub_upstreams.py, so nothing leaves the machine.
+
+N simulated sessions create baskets concurrently; the report lists
+p50/p95/p99 latency per stage and overall throughput:
+
+    python benchmarks/e2e_pipeline.py --sessions 8 --baskets 5
+    python benchmarks/e2e_pipeline.py --sessions 32 --latency pollinations=6 --error-rate imgur=0.1
+
+"page" is what a user waits for (text and image, then composition and
+the preview rendition); "delivery" is the background Imgur + Telegram
+work that follows. With --variants K, "first" is when the first of the K
+images was ready (what the app shows first) and "image" when all were.
+With --draft, "draft" is when the turbo draft arrived.
+"""
+import io
+import os
+import math
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_upstreams import StubUpstreams, add_stub_arguments, config_from_args, env_for  # noqa: E402
+
+STAGES = ("translate", "draft", "first", "image", "text", "compose", "renditions", "page", "imgur", "telegram", "delivery")
+
+
+class Recorder:
+    """Thread-safe latency samples and failure counts per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES}
+        self.failures = {stage: 0 for stage in STAGES}
+
+    def timed(self, stage, fn, *args, **kwargs):
+        """Call fn, record its duration and whether it failed (raised or returned None)."""
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"{stage} failed: {str(e)}")
+            result = None
+        self.record(stage, time.perf_counter() - started, result is not None)
+        return result
+
+    def record(self, stage, seconds, ok=True):
+        with self._lock:
+            self.samples[stage].append(seconds)
+            if not ok:
+                self.failures[stage] += 1
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an unsorted list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def make_photo(size=(3024, 4032)) -> bytes:
+    """A phone-sized JPEG to exercise the personal photo path."""
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 32).convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def generate_variants(app, recorder, items, count, model):
+    """The images of a variant-mode basket; records when the first one was ready."""
+    pollinations = app.get_pollinations()
+    seeds = [pollinations.seed + i for i in range(count)]
+    started = time.perf_counter()
+    first = None
+    for seed, image_url, image_bytes in pollinations.generate_variants(items, seeds, model=model):
+        if image_bytes is not None and first is None:
+            recorder.record("first", time.perf_counter() - started)
+            first = (image_url, image_bytes)
+    return first
+
+
+def run_basket(app, recorder, dispatcher, items, photo, variants=1, model=None, draft=False):
+    """One basket, stage by stage, the way the app produces and delivers it."""
+    from utils.item_translator import get_item_translator
+    from utils.pipeline import StageGroup, StageFailed, StageTimeout
+    from utils.renditions import Renditions
+    from utils.imgur_uploader import get_imgur_uploader, IMGUR_FALLBACK_URL
+
+    started = time.perf_counter()
+    # Translation is part of generate_image; timing it separately shows cache hits vs misses
+    recorder.timed("translate", get_item_translator().translate_many, [i.strip() for i in items.split(",")])
+
+    stages = StageGroup()
+    if draft:
+        # The turbo draft the app shows while the final image is generated
+        drafted = time.perf_counter()
+        future = app.get_pollinations().generate_draft(items, size=app.DRAFT_SIZE, cancel_event=stages.cancel_event)
+        future.add_done_callback(lambda f: recorder.record("draft", time.perf_counter() - drafted,
+                                                           not f.cancelled() and f.result() is not None))
+    if variants > 1:
+        # "image" is then the time until every variant is ready
+        stages.submit("image", recorder.timed, "image", generate_variants, app, recorder, items, variants, model,
+                      timeout=app.IMAGE_STAGE_TIMEOUT)
+    else:
+        stages.submit("image", recorder.timed, "image", app.generate_image, items, model=model,
+                      timeout=app.IMAGE_STAGE_TIMEOUT)
+    stages.submit("text", recorder.timed, "text", app.generate_hebrew_text, items, timeout=app.TEXT_STAGE_TIMEOUT)
+    try:
+        results = stages.join()
+    except (StageFailed, StageTimeout) as e:
+        print(f"basket failed: {str(e)}")
+        recorder.record("page", time.perf_counter() - started, ok=False)
+        return
+    _, basket_bytes = results["image"]
+
+    user_image = io.BytesIO(photo) if photo else None
+    image = recorder.timed("compose", app.compose_final_image, basket_bytes, results["text"], user_image)
+    if image is None:
+        recorder.record("page", time.perf_counter() - started, ok=False)
+        return
+    renditions = Renditions(image=image)
+    recorder.timed("renditions", renditions.get, "preview")
+    recorder.record("page", time.perf_counter() - started)
+
+    def upload_to_imgur():
+        url = get_imgur_uploader().upload_bytes(renditions.get("share"), "image", "Bikkurim Basket", items)
+        return None if url == IMGUR_FALLBACK_URL else url
+
+    def send_to_telegram():
+        delivery = dispatcher.submit(renditions.get("telegram"), caption=items,
+                                     filename=renditions.filename("telegram"),
+                                     content_type=renditions.mime_type("telegram"))
+        return delivery.result(timeout=600)
+
+    # The outbox runs both in the background, in parallel
+    delivered = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        imgur = pool.submit(recorder.timed, "imgur", upload_to_imgur)
+        telegram = pool.submit(recorder.timed, "telegram", send_to_telegram)
+        ok = imgur.result() is not None and telegram.result() is not None
+    recorder.record("delivery", time.perf_counter() - delivered, ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions")
+    parser.add_argument("--baskets", type=int, default=3, help="Baskets each session creates, one after another")
+    parser.add_argument("--items", type=int, default=3, help="Items per basket, drawn from item_ideas.json")
+    parser.add_argument("--new-item-rate", type=float, default=0.3,
+                        help="Chance a basket also has an item never seen before (a translation miss)")
+    parser.add_argument("--variants", type=int, default=1, help="Images per basket, as in the app's variant mode")
+    parser.add_argument("--model", choices=("flux", "turbo"), help="Pollinations model (default: the generator's)")
+    parser.add_argument("--draft", action="store_true",
+                        help="Also request the low-resolution turbo draft of the app's progressive preview")
+    parser.add_argument("--photo", action="store_true", help="Add a 12MP personal photo to every basket")
+    parser.add_argument("--telegram-rate", type=float, default=6000,
+                        help="Telegram dispatcher messages per minute (the app uses 20, Telegram's group limit)")
+    parser.add_argument("--stub-url", help="Use stub upstreams already running there instead of starting them")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--trace", action="store_true", help="Print every span as a JSON log line")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    os.chdir(ROOT)  # fonts and JSON assets are opened relative to the working directory
+    with open("item_ideas.json", encoding="utf-8") as f:
+        ideas = [idea["name"] for idea in json.load(f)]
+    photo = make_photo() if args.photo else None
+
+    stub = None
+    if args.stub_url:
+        url = args.stub_url.rstrip("/")
+    else:
+        stub = StubUpstreams(config_from_args(args)).__enter__()
+        url = stub.url
+    # Must be in place before the app's modules read them
+    os.environ.update(env_for(url))
+    os.environ["TRACE_LOG"] = "1" if args.trace else "0"
+
+    from streamlit.logger import set_log_level
+    set_log_level("error")  # bare-mode context warnings from every worker thread
+    import app
+    from utils.telegram_dispatcher import TelegramDispatcher
+    from utils.tracing import request_context
+    from utils import http_client
+    dispatcher = TelegramDispatcher(rate_per_minute=args.telegram_rate, burst=max(3, args.sessions)).start()
+
+    recorder = Recorder()
+    run_id = "%06x" % random.getrandbits(24)
+
+    def session(n):
+        for i in range(args.baskets):
+            items = random.sample(ideas, args.items)
+            if random.random() < args.new_item_rate:
+                items.append(f"פריט {run_id}-{n}-{i}")
+            with request_context(f"session-{n}"), http_client.deadline(app.BASKET_BUDGET):
+                run_basket(app, recorder, dispatcher, ", ".join(items), photo, args.variants, args.model,
+                           args.draft)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(session, range(args.sessions)))
+    elapsed = time.perf_counter() - started
+    if stub is not None:
+        stub.__exit__(None, None, None)
+
+    total = args.sessions * args.baskets
+    completed = len(recorder.samples["page"]) - recorder.failures["page"]
+    print(f"\n{args.sessions} sessions x {args.baskets} baskets, image {args.image_size}px"
+          f"{', with personal photo' if photo else ''}")
+    print(f"{'stage':<12} {'n':>5} {'fail':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in STAGES:
+        values = recorder.samples[stage]
+        if not values:
+            continue
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.50, 0.95, 0.99))
+        print(f"{stage:<12} {len(values):5d} {recorder.failures[stage]:5d} "
+              f"{p50:9.1f} {p95:9.1f} {p99:9.1f} {max(values) * 1000:9.1f}")
+    print(f"\n{completed}/{total} baskets in {elapsed:.1f}s: {completed / elapsed:.2f} baskets/s")
+    if stub is not None:
+        print(f"upstream requests: {stub.requests()}")
+    print(f"http client: {http_client.stats()}")
+
+
+if __name__ == "__main__":
+    main()
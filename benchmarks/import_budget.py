@@ -0,0 +1,102 @@
+"""
+Import-time budget for app.py.
+
+Imports the app in a fresh interpreter with `python -X importtime`, after
+streamlit itself (which every Streamlit app pays for), and reports what
+app.py adds on top: its cumulative import time, the slowest modules it
+pulls in, and any heavy SDK that should only load on first use.
+
+Exits non-zero when the budget is exceeded or a lazy module is imported
+eagerly, so it can run in CI:
+
+    python benchmarks/import_budget.py --budget-ms 150
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use by the app; none of them may be imported by `import app`
+LAZY_MODULES = ("together", "aiohttp", "deep_translator", "speech_recognition", "arabic_reshaper", "bidi")
+
+PROBE = (
+    "import sys, streamlit, app; "
+    "print('LOADED=' + ','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def run_once():
+    """
+    :return: (app cumulative µs, {module: self µs} for modules imported by app, eagerly loaded lazy modules)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(lazy=LAZY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    loaded = []
+    for line in proc.stdout.splitlines():
+        if line.startswith("LOADED="):
+            loaded = [m for m in line[len("LOADED="):].split(",") if m]
+
+    # importtime prints children before their parent, so everything between
+    # the streamlit line and the app line was imported on behalf of app
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header
+        rows.append((fields[2].strip(), self_us, cumulative_us))
+    names = [name for name, _, _ in rows]
+    start = names.index("streamlit") + 1
+    end = names.index("app")
+    modules = {name: self_us for name, self_us, _ in rows[start:end + 1]}
+    return rows[end][2], modules, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "150")),
+                        help="Maximum median import time of app.py on top of streamlit (ms)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest modules to list")
+    args = parser.parse_args()
+
+    totals = []
+    slowest = {}
+    loaded = set()
+    for _ in range(args.runs):
+        total_us, modules, eager = run_once()
+        totals.append(total_us / 1000)
+        loaded.update(eager)
+        for name, self_us in modules.items():
+            slowest.setdefault(name, []).append(self_us / 1000)
+
+    median = statistics.median(totals)
+    print(f"import app (after streamlit): median {median:.1f} ms, "
+          f"min {min(totals):.1f} ms, max {max(totals):.1f} ms over {args.runs} runs")
+    print("slowest modules imported by app (median self time):")
+    ranked = sorted(slowest.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, times in ranked[:args.top]:
+        print(f"  {statistics.median(times):8.1f} ms  {name}")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: imported eagerly, should load on first use: {', '.join(sorted(loaded))}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: {median:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print(f"OK: within the {args.budget_ms:.0f} ms budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Per-interaction rerun cost of app.py.
+
+Drives the app headlessly with streamlit.testing.v1.AppTest and, for each
+interaction, measures the script run's wall time and the bytes of the
+ForwardMsgs it sends to the browser (serialized protobuf, before the
+server's message cache and compression).
+
+AppTest always reruns the whole script, while the browser asks for a
+fragment-only rerun when the clicked widget lives inside an st.fragment.
+The runner is patched to do the same: it remembers which fragment each
+widget was rendered in and scopes the rerun accordingly, so the numbers
+match what a real session sends.
+
+    python benchmarks/rerun_cost.py --runs 10
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData, ScriptRequests  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1 import local_script_runner  # noqa: E402
+from streamlit.logger import set_log_level  # noqa: E402
+
+# widget id -> fragment id, from the most recent full run
+_widget_fragments = {}
+# (seconds, bytes, fragment-scoped) of the most recent run
+_last_run = {}
+# Widget the simulated user interacts with in the next run
+_target = {"id": None}
+
+
+def _widget_id(delta):
+    element = delta.new_element
+    kind = element.WhichOneof("type")
+    return getattr(getattr(element, kind, None), "id", None) if kind else None
+
+
+def _run(self, widget_state=None, query_params=None, timeout=3, page_hash=""):
+    """LocalScriptRunner.run, with fragment-scoped reruns and measurement."""
+    # What the browser does: a widget inside a fragment reruns only that fragment
+    fragment_id = _widget_fragments.get(_target["id"])
+    _target["id"] = None
+    rerun_data = RerunData(widget_states=widget_state, page_script_hash=page_hash, fragment_id=fragment_id)
+    # The runner is created with a pending full rerun, which would absorb ours
+    self._requests = ScriptRequests()
+    started = time.perf_counter()
+    self.request_rerun(rerun_data)
+    try:
+        if not self._script_thread:
+            self.start()
+        local_script_runner.require_widgets_deltas(self, timeout)
+    finally:
+        self.join()
+    elapsed = time.perf_counter() - started
+
+    messages = self.forward_msgs()
+    _last_run.update(seconds=elapsed, bytes=sum(m.ByteSize() for m in messages), fragment=bool(fragment_id))
+    if not fragment_id:
+        _widget_fragments.clear()
+    for message in messages:
+        if message.WhichOneof("type") == "delta" and message.delta.fragment_id:
+            widget_id = _widget_id(message.delta)
+            if widget_id:
+                _widget_fragments[widget_id] = message.delta.fragment_id
+    return local_script_runner.parse_tree_from_messages(messages)
+
+
+def _interact(widget, act):
+    _target["id"] = widget.id
+    act(widget).run()
+
+
+# Interactions measured on a freshly loaded page
+INTERACTIONS = {
+    "first load": None,
+    "toggle icon": lambda app: _interact(next(b for b in app.button if b.key.startswith("icon_")),
+                                         lambda w: w.click()),
+    "pick example": lambda app: _interact(app.button(key="ex_0"), lambda w: w.click()),
+    "edit items text": lambda app: _interact(app.text_area(key="items_input"), lambda w: w.input("תפוחים, דבש")),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    set_log_level("error")  # bare-mode context warnings on every run
+    os.chdir(ROOT)  # app.py opens its assets relative to the working directory
+    local_script_runner.LocalScriptRunner.run = _run
+
+    print(f"{'interaction':<20} {'median ms':>10} {'p95 ms':>8} {'bytes':>8}  scope")
+    for name, interact in INTERACTIONS.items():
+        seconds, sizes, scoped = [], [], False
+        for _ in range(args.runs):
+            app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+            app.run()
+            if interact is not None:
+                interact(app)
+            seconds.append(_last_run["seconds"] * 1000)
+            sizes.append(_last_run["bytes"])
+            scoped = _last_run["fragment"]
+        p95 = statistics.quantiles(seconds, n=20)[-1] if len(seconds) > 1 else seconds[0]
+        print(f"{name:<20} {statistics.median(seconds):10.1f} {p95:8.1f} {int(statistics.median(sizes)):8d}  "
+              f"{'fragment' if scoped else 'full script'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local stand-ins for the app's upstream services, for offline benchmarks.
+
+One threaded HTTP server answers for all of them, each under its own path
+prefix, with configurable latency and error rate per upstream:
+
+    /pollinations/prompt/<prompt>        Pollinations image generation (JPEG); turbo is 4x faster
+    /together/v1/chat/completions        Together AI chat, plain or SSE stream
+    /translate                           Google Translate's mobile page
+    /imgur/3/upload                      Imgur upload
+    /telegram/bot<token>/<method>        Telegram Bot API
+
+env_for() returns the environment variables that point the app at it.
+Run standalone to poke at it by hand:
+
+    python benchmarks/stub_upstreams.py --port 8765 --latency pollinations=2
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+UPSTREAMS = ("pollinations", "together", "translate", "imgur", "telegram")
+
+# Typical response times of the real services, in seconds
+DEFAULT_LATENCY = {"pollinations": 3.0, "together": 1.0, "translate": 0.2, "imgur": 0.8, "telegram": 0.4}
+
+# Pollinations' turbo model renders in about this share of flux's time
+TURBO_LATENCY_SHARE = 0.25
+
+BLESSING = "סל מלא בשפע ובשמחה, שיהיה לכם חג שבועות שמח!"
+
+
+class StubConfig:
+    """Latency (mean seconds, +/- `jitter` of it), error rate and image size for the stand-ins."""
+
+    def __init__(self, latency=None, error_rate=None, image_size=1024, jitter=0.5, stream_chunks=8):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.error_rate = {name: 0.0 for name in UPSTREAMS}
+        self.error_rate.update(error_rate or {})
+        self.image_size = image_size
+        self.jitter = jitter
+        self.stream_chunks = stream_chunks
+        self.image = _make_image(image_size)
+        self._sized = {}
+        self._sized_lock = threading.Lock()
+
+    def delay(self, upstream: str, share: float = 1.0) -> float:
+        mean = self.latency[upstream] * share
+        return max(0.0, mean * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def image_for(self, width: int = None, height: int = None) -> bytes:
+        """The image at a requested size, e.g. a Pollinations draft"""
+        if not width or not height or (width, height) == (self.image_size, self.image_size):
+            return self.image
+        with self._sized_lock:
+            if (width, height) not in self._sized:
+                resized = Image.open(io.BytesIO(self.image)).resize((width, height))
+                buffer = io.BytesIO()
+                resized.save(buffer, "JPEG", quality=88)
+                self._sized[(width, height)] = buffer.getvalue()
+            return self._sized[(width, height)]
+
+    def fails(self, upstream: str) -> bool:
+        return random.random() < self.error_rate[upstream]
+
+
+def _make_image(size: int) -> bytes:
+    """A size x size JPEG with enough detail to compress like a real photo."""
+    noise = Image.effect_noise((size, size), 48).convert("RGB")
+    gradient = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    buffer = io.BytesIO()
+    Image.blend(noise, gradient, 0.6).save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = None
+    counters: dict = None
+    counters_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _upstream(self, path: str) -> str:
+        name = path.lstrip("/").split("/", 1)[0]
+        return name if name in UPSTREAMS else ""
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data: dict, headers=None):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), headers=headers)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _handle(self, method: str):
+        path = urlparse(self.path).path
+        upstream = self._upstream(path)
+        body = self._read_body() if method == "POST" else b""
+        if not upstream:
+            return self._json(404, {"error": "unknown upstream"})
+        with self.counters_lock:
+            self.counters[upstream] = self.counters.get(upstream, 0) + 1
+
+        query = parse_qs(urlparse(self.path).query)
+        turbo = upstream == "pollinations" and query.get("model") == ["turbo"]
+        time.sleep(self.config.delay(upstream, TURBO_LATENCY_SHARE if turbo else 1.0))
+        if self.config.fails(upstream):
+            if upstream == "telegram":
+                return self._json(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}})
+            return self._json(500, {"error": "injected failure"})
+        getattr(self, f"_{upstream}")(path, body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _pollinations(self, path, body):
+        query = parse_qs(urlparse(self.path).query)
+        width, height = (int(query[name][0]) if name in query else None for name in ("width", "height"))
+        self._send(200, self.config.image_for(width, height), "image/jpeg")
+
+    def _translate(self, path, body):
+        text = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        translated = "\n".join(f"item {abs(hash(line)) % 10000}" for line in text.split("\n"))
+        html = f'<html><body><div class="t0">{translated}</div></body></html>'
+        self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def _together(self, path, body):
+        request = json.loads(body or b"{}")
+        created = int(time.time())
+        if not request.get("stream"):
+            return self._json(200, {
+                "id": "stub", "object": "chat.completion", "created": created, "model": request.get("model", ""),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": BLESSING}}],
+                "usage": {"prompt_tokens": 40, "completion_tokens": 20, "total_tokens": 60},
+            })
+        # Server-sent events, one word group per chunk
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = BLESSING.split(" ")
+        step = max(1, len(words) // self.config.stream_chunks)
+        for i in range(0, len(words), step):
+            piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "created": created,
+                     "model": request.get("model", ""),
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(0.02)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _imgur(self, path, body):
+        image_id = "%07x" % random.getrandbits(28)
+        self._json(200, {"data": {"id": image_id, "link": f"https://i.imgur.com/{image_id}.jpg"},
+                         "success": True, "status": 200})
+
+    def _telegram(self, path, body):
+        self._json(200, {"ok": True, "result": {"message_id": random.getrandbits(31)}})
+
+
+class StubUpstreams:
+    """The stub server on a background thread. Use as a context manager."""
+
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (_Handler,), {"config": config, "counters": {}})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.handler = handler
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-upstreams", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def requests(self) -> dict:
+        """Requests received so far, per upstream."""
+        with self.handler.counters_lock:
+            return dict(self.handler.counters)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def env_for(url: str) -> dict:
+    """Environment variables that send every upstream call of the app to the stub at `url`."""
+    return {
+        "POLLINATIONS_API_URL": f"{url}/pollinations/prompt/",
+        "TOGETHER_BASE_URL": f"{url}/together/v1",
+        "TOGETHER_API_KEY": "stub",
+        "GOOGLE_TRANSLATE_URL": f"{url}/translate",
+        "IMGUR_UPLOAD_URL": f"{url}/imgur/3/upload",
+        "IMGUR_CLIENT_ID": "stub",
+        "TELEGRAM_API_URL": f"{url}/telegram",
+        "TELEGRAM_BOT_TOKEN": "stub",
+        "TELEGRAM_CHAT_ID": "stub",
+    }
+
+
+def parse_overrides(pairs, upstreams=UPSTREAMS) -> dict:
+    """['pollinations=2', 'imgur=0.5'] -> {'pollinations': 2.0, 'imgur': 0.5}"""
+    overrides = {}
+    for pair in pairs or ():
+        name, _, value = pair.partition("=")
+        if name not in upstreams:
+            raise argparse.ArgumentTypeError(f"unknown upstream {name!r}; expected one of {', '.join(upstreams)}")
+        overrides[name] = float(value)
+    return overrides
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=SECONDS",
+                        help=f"Mean response time of an upstream (defaults: {DEFAULT_LATENCY})")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=FRACTION",
+                        help="Share of requests an upstream fails (Telegram answers 429, the rest 500)")
+    parser.add_argument("--image-size", type=int, default=1024, help="Side of the generated basket image (px)")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies by +/- this share of the mean")
+
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(latency=parse_overrides(args.latency), error_rate=parse_overrides(args.error_rate),
+                      image_size=args.image_size, jitter=args.jitter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    with StubUpstreams(config_from_args(args), port=args.port) as stub:
+        print(f"Stub upstreams on {stub.url}; point the app at them with:")
+        for name, value in env_for(stub.url).items():
+            print(f"  export {name}={value}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
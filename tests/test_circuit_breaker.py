@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from utils.http_client import CircuitBreaker, CircuitOpen, HttpClient, DeadlineExceeded, breaker, deadline
+
+
+def open_breaker(cooldown=0.05):
+    circuit = CircuitBreaker("test", threshold=3, cooldown=cooldown)
+    for _ in range(3):
+        circuit.before_call()
+        circuit.record_failure()
+    return circuit
+
+
+def test_closed_until_threshold():
+    circuit = CircuitBreaker("test", threshold=3)
+    for _ in range(2):
+        assert circuit.before_call() is None
+        circuit.record_failure()
+    assert circuit.state == "closed"
+    circuit.record_failure()
+    assert circuit.state == "open"
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+    assert circuit.rejected == 1
+
+
+def test_success_resets_failure_count():
+    circuit = CircuitBreaker("test", threshold=2)
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    assert circuit.state == "closed"
+
+
+def test_one_trial_after_cooldown():
+    circuit = open_breaker()
+    time.sleep(0.06)
+    assert circuit.state == "half_open"
+    assert circuit.before_call() is not None
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+
+
+def test_trial_success_closes():
+    circuit = open_breaker()
+    time.sleep(0.06)
+    circuit.before_call()
+    circuit.record_success()
+    assert circuit.state == "closed"
+    assert circuit.before_call() is None
+
+
+def test_trial_failure_reopens():
+    circuit = open_breaker()
+    time.sleep(0.06)
+    circuit.before_call()
+    circuit.record_failure()
+    assert circuit.state == "open"
+    assert circuit.opened == 2
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+
+
+def test_released_trial_lets_the_next_call_through():
+    circuit = open_breaker()
+    time.sleep(0.06)
+    trial = circuit.before_call()
+    circuit.release(trial)  # e.g. answered 429
+    assert circuit.state == "half_open"
+    assert circuit.before_call() is not None
+
+
+def test_stale_release_keeps_the_current_trial():
+    circuit = open_breaker(cooldown=0)
+    first = circuit.before_call()
+    circuit.record_failure()
+    second = circuit.before_call()
+    circuit.release(first)
+    with pytest.raises(CircuitOpen):
+        circuit.before_call()
+    circuit.release(second)
+    assert circuit.before_call() is not None
+
+
+def test_expired_deadline_does_not_take_the_trial():
+    circuit = breaker("deadline-test")
+    circuit.cooldown = 0
+    for _ in range(circuit.threshold):
+        circuit.record_failure()
+    client = HttpClient()
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            client.request("GET", "http://127.0.0.1:9/", "deadline-test", retries=0)
+    assert circuit.before_call() is not None
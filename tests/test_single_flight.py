@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+class Interrupted(BaseException):
+    """Stands in for Streamlit's RerunException/StopException."""
+
+
+def run_follower(flight, key, fn, results):
+    def follower():
+        try:
+            results.append(flight.do(key, fn))
+        except BaseException as e:
+            results.append(e)
+    thread = threading.Thread(target=follower)
+    thread.start()
+    return thread
+
+
+def wait_for_follower(flight):
+    while flight.stats()["coalesced"] == 0:
+        threading.Event().wait(0.001)
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = []
+
+    def leader_fn():
+        release.wait()
+        return "basket"
+
+    leader = run_follower(flight, "k", leader_fn, results)
+    while flight.stats()["in_flight"] == 0:
+        threading.Event().wait(0.001)
+    follower = run_follower(flight, "k", lambda: "not run", results)
+    wait_for_follower(flight)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ["basket", "basket"]
+    assert flight.stats() == {"executed": 1, "coalesced": 1, "in_flight": 0}
+
+
+def test_followers_share_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = []
+
+    def leader_fn():
+        release.wait()
+        raise ValueError("upstream down")
+
+    leader = run_follower(flight, "k", leader_fn, results)
+    while flight.stats()["in_flight"] == 0:
+        threading.Event().wait(0.001)
+    follower = run_follower(flight, "k", lambda: "not run", results)
+    wait_for_follower(flight)
+    release.set()
+    leader.join()
+    follower.join()
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_interrupted_leader_hands_over_to_a_follower():
+    flight = SingleFlight()
+    release = threading.Event()
+    results = []
+
+    def leader_fn():
+        release.wait()
+        raise Interrupted()
+
+    leader = run_follower(flight, "k", leader_fn, results)
+    while flight.stats()["in_flight"] == 0:
+        threading.Event().wait(0.001)
+    follower = run_follower(flight, "k", lambda: "basket", results)
+    wait_for_follower(flight)
+    release.set()
+    leader.join()
+    follower.join()
+    assert isinstance(results[0], Interrupted)
+    assert results[1] == "basket"
+    assert flight.stats()["executed"] == 2
+
+
+def test_interrupt_is_raised_in_the_leader():
+    flight = SingleFlight()
+
+    def leader_fn():
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        flight.do("k", leader_fn)
+    assert flight.do("k", lambda: 1) == 1
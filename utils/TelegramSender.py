@@ -1,13 +1,23 @@
 import os
 from dotenv import load_dotenv
+import json
 import asyncio
 import aiohttp
-from typing import Optional
+from typing import List, Optional, Tuple
 from io import BytesIO
 
+from utils.http_client import breaker, CircuitOpen, TIMEOUTS
+
 # Load environment variables from .env file
 load_dotenv()
 
+class TelegramRateLimited(Exception):
+    """Telegram answered 429; wait `retry_after` seconds before the next request."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited by Telegram, retry after {retry_after}s")
+        self.retry_after = retry_after
+
 class TelegramSender:
     def __init__(self):
         self.bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -15,12 +25,14 @@ class TelegramSender:
         self.MAX_CAPTION_LENGTH = 1024  # Telegram's limit
         if not self.bot_token or not self.chat_id:
             raise ValueError("TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID must be set in environment variables")
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.base_url = f"{os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')}/bot{self.bot_token}"
         self.session = None
 
     async def ensure_session(self):
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession()
+            connect, read = TIMEOUTS["telegram"]
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read))
 
     async def close_session(self):
         if self.session and not self.session.closed:
@@ -37,17 +49,37 @@ class TelegramSender:
     async def _make_request(self, method: str, endpoint: str, **kwargs):
         await self.ensure_session()
         url = f"{self.base_url}/{endpoint}"
+        # Same breaker as the synchronous client, so both back off from a failing Telegram
+        circuit = breaker("telegram")
+        trial = None
         try:
+            trial = circuit.before_call()
             async with getattr(self.session, method)(url, **kwargs) as response:
+                if response.status == 429:
+                    body = await response.json(content_type=None)
+                    raise TelegramRateLimited(body.get("parameters", {}).get("retry_after", 1))
+                if response.status >= 500:
+                    circuit.record_failure()
+                else:
+                    circuit.record_success()
                 if response.status != 200:
                     response_text = await response.text()
                     print(f"Failed to {endpoint}. Status: {response.status}")
                     print(f"Response: {response_text}")
                     return None
                 return await response.json()
+        except TelegramRateLimited:
+            raise
+        except CircuitOpen as e:
+            print(f"Skipping {endpoint}: {str(e)}")
+            return None
         except Exception as e:
+            circuit.record_failure()
             print(f"Error making request: {str(e)}")
             return None
+        finally:
+            # A 429 says nothing about Telegram's health; let the next call be the trial
+            circuit.release(trial)
 
     async def verify_bot_token(self):
         result = await self._make_request('get', 'getMe')
@@ -55,11 +87,12 @@ class TelegramSender:
             return True
         return False
 
-    async def send_photo_bytes(self, photo_bytes: BytesIO, caption: Optional[str] = None) -> None:
+    async def send_photo_bytes(self, photo_bytes: BytesIO, caption: Optional[str] = None,
+                               filename: str = "generated_image.png", content_type: str = "image/png") -> None:
         try:
             data = aiohttp.FormData()
             data.add_field("chat_id", self.chat_id)
-            data.add_field("photo", photo_bytes, filename="generated_image.png", content_type="image/png")
+            data.add_field("photo", photo_bytes, filename=filename, content_type=content_type)
             
             if caption:
                 truncated_caption = self._truncate_caption(caption)
@@ -69,10 +102,41 @@ class TelegramSender:
             if result:
                 print("Photo sent successfully to Telegram")
             return result
+        except TelegramRateLimited:
+            raise
         except Exception as e:
             print(f"Error sending photo: {str(e)}")
             return None
 
+    async def send_media_group(self, photos: List[Tuple[bytes, str, str, Optional[str]]]):
+        """
+        Send 2-10 photos as one album in a single request.
+
+        :param photos: Tuples of (photo_bytes, filename, content_type, caption).
+        :raises TelegramRateLimited: When Telegram asks us to slow down.
+        """
+        try:
+            data = aiohttp.FormData()
+            data.add_field("chat_id", self.chat_id)
+            media = []
+            for i, (photo_bytes, filename, content_type, caption) in enumerate(photos):
+                item = {"type": "photo", "media": f"attach://photo{i}"}
+                if caption:
+                    item["caption"] = self._truncate_caption(caption)
+                media.append(item)
+                data.add_field(f"photo{i}", photo_bytes, filename=filename, content_type=content_type)
+            data.add_field("media", json.dumps(media, ensure_ascii=False))
+
+            result = await self._make_request('post', 'sendMediaGroup', data=data)
+            if result:
+                print(f"Media group of {len(photos)} photos sent successfully to Telegram")
+            return result
+        except TelegramRateLimited:
+            raise
+        except Exception as e:
+            print(f"Error sending media group: {str(e)}")
+            return None
+
     async def send_message(self, text: str, title: Optional[str] = None) -> None:
         try:
             message_text = text
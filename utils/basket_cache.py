@@ -0,0 +1,157 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Optional, Tuple
+
+from utils.item_translator import normalize_item
+
+CACHE_DIR = os.path.join(".cache", "baskets")
+
+BASKET_FILE = "basket.img"
+BLESSING_FILE = "blessing.txt"
+FINAL_FILE = "final.png"
+
+
+def normalize_items(items_text: str) -> Tuple[str, ...]:
+    """Order-insensitive, de-duplicated item set of a comma-separated basket."""
+    items = {normalize_item(item) for item in items_text.split(',')}
+    items.discard("")
+    return tuple(sorted(items))
+
+
+def basket_key(items_text: str, **render_params) -> str:
+    """
+    Content address of a basket: its normalized items plus every parameter
+    that changes the rendered result (model, seed, layout version...).
+    """
+    payload = json.dumps(
+        {"items": normalize_items(items_text), "params": render_params},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BasketCache:
+    """
+    On-disk cache of finished baskets, one directory per key.
+
+    Each entry holds the generated basket image, the blessing text and,
+    when available, the final composed PNG and its encoded renditions. Entries are evicted least
+    recently used first once the total size exceeds `max_bytes`; recency is
+    the directory's mtime, so several processes can share one cache.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        :return: Dict with 'basket' (bytes), 'blessing' (str, or None for an
+                 image still waiting for its blessing) and 'final' (bytes or
+                 None), or None on a miss.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, BASKET_FILE), "rb") as f:
+                basket = f.read()
+        except OSError:
+            return None
+        blessing = final = None
+        try:
+            with open(os.path.join(entry_dir, BLESSING_FILE), encoding="utf-8") as f:
+                blessing = f.read()
+            with open(os.path.join(entry_dir, FINAL_FILE), "rb") as f:
+                final = f.read()
+        except OSError:
+            pass
+        try:
+            os.utime(entry_dir)  # mark as recently used
+        except OSError:
+            pass
+        return {"basket": basket, "blessing": blessing, "final": final}
+
+    def get_rendition(self, key: str, name: str) -> Optional[bytes]:
+        """Encoded rendition stored alongside an entry, or None."""
+        try:
+            with open(os.path.join(self._entry_dir(key), f"rendition-{name}"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put_rendition(self, key: str, name: str, data: bytes):
+        """Store an encoded rendition alongside an existing entry."""
+        self._put_file(key, f"rendition-{name}", data)
+
+    def put_final(self, key: str, final_bytes: bytes):
+        """Add the composed PNG to an existing entry, e.g. once it has been shown."""
+        self._put_file(key, FINAL_FILE, final_bytes)
+
+    def _put_file(self, key: str, filename: str, data: bytes):
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return
+        path = os.path.join(entry_dir, filename)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to cache {filename}: {str(e)}")
+
+    def put(self, key: str, basket_bytes: bytes, blessing: Optional[str], final_bytes: Optional[bytes] = None):
+        """
+        Store an entry atomically, replacing any previous one, then enforce the size cap.
+
+        :param blessing: None keeps only the image, e.g. while the blessing is a
+                         bank stand-in; the composition then isn't stored either.
+        """
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            with open(os.path.join(tmp_dir, BASKET_FILE), "wb") as f:
+                f.write(basket_bytes)
+            if blessing is None:
+                final_bytes = None
+            else:
+                with open(os.path.join(tmp_dir, BLESSING_FILE), "w", encoding="utf-8") as f:
+                    f.write(blessing)
+            if final_bytes is not None:
+                with open(os.path.join(tmp_dir, FINAL_FILE), "wb") as f:
+                    f.write(final_bytes)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            print(f"Failed to cache basket: {str(e)}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith(".tmp") or not os.path.isdir(path):
+                    continue
+                try:
+                    size = sum(e.stat().st_size for e in os.scandir(path))
+                    entries.append((os.stat(path).st_mtime, size, path))
+                except OSError:
+                    continue
+                total += size
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
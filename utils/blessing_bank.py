@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+from utils.basket_cache import normalize_items
+
+BANK_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "blessings.json")
+LEARNED_FILE = os.path.join(".cache", "blessing_bank.json")
+
+_DONE = object()
+# How often a waiting stream checks its cancel event and deadline
+_POLL = 0.2
+
+
+def _index_key(items_text: str) -> str:
+    return "|".join(normalize_items(items_text))
+
+
+def _join_hebrew(items) -> str:
+    """'א', 'ב', 'ג' -> 'א, ב וג'"""
+    if len(items) == 1:
+        return items[0]
+    return ", ".join(items[:-1]) + " ו" + items[-1]
+
+
+class BlessingBank:
+    """
+    Local store of short Hebrew blessings for instant fallback.
+
+    The shipped blessings.json holds a blessing for every examples.json
+    preset, a wish per known item and a few templates; together they can
+    produce a blessing for any basket. Blessings the LLM writes for real
+    baskets are learned into an on-disk index (capped, least recently
+    used out) and preferred over the built-in ones next time.
+    """
+
+    def __init__(self, bank_file: str = BANK_FILE, learned_file: str = LEARNED_FILE, max_learned: int = 2000):
+        self.learned_file = learned_file
+        self.max_learned = max_learned
+        self._lock = threading.Lock()
+        with open(bank_file, encoding="utf-8") as f:
+            bank = json.load(f)
+        self.templates = bank["templates"]
+        self.default_wish = bank["default_wish"]
+        self.wishes = {normalize_items(k)[0]: v for k, v in bank["items"].items()}
+        self.presets = {_index_key(k): v for k, v in bank["presets"].items()}
+        try:
+            with open(learned_file, encoding="utf-8") as f:
+                self.learned = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.learned = OrderedDict()
+
+    def lookup(self, items_text: str) -> str:
+        """
+        Best available blessing for a basket: a learned LLM blessing, then the
+        preset's, then one combined from the item wishes and a template.
+        """
+        key = _index_key(items_text)
+        with self._lock:
+            if key in self.learned:
+                self.learned.move_to_end(key)
+                return self.learned[key]
+        if key in self.presets:
+            return self.presets[key]
+        return self.combine(items_text)
+
+    def combine(self, items_text: str) -> str:
+        """Build a blessing for any basket from the per-item wishes."""
+        items = [item for item in (i.strip() for i in items_text.split(',')) if item]
+        if not items:
+            return self.default_wish + "!"
+        # Stable choice per basket, varied across baskets
+        seed = int(hashlib.md5(_index_key(items_text).encode("utf-8")).hexdigest(), 16)
+        known = [item for item in normalize_items(items_text) if item in self.wishes]
+        wish = self.wishes[known[seed % len(known)]] if known else self.default_wish
+        template = self.templates[seed % len(self.templates)]
+        return template.format(items=_join_hebrew(items), wish=wish)
+
+    def learn(self, items_text: str, blessing: str):
+        """Remember a real LLM blessing for this basket and persist the index."""
+        blessing = blessing.strip()
+        key = _index_key(items_text)
+        if not blessing or not key:
+            return
+        with self._lock:
+            self.learned[key] = blessing
+            self.learned.move_to_end(key)
+            while len(self.learned) > self.max_learned:
+                self.learned.popitem(last=False)
+            try:
+                os.makedirs(os.path.dirname(self.learned_file) or ".", exist_ok=True)
+                tmp_path = f"{self.learned_file}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.learned, f, ensure_ascii=False)
+                os.replace(tmp_path, self.learned_file)
+            except OSError as e:
+                print(f"Failed to save blessing bank: {str(e)}")
+
+
+def stream_with_fallback(stream_factory: Callable[[], Iterator[str]], fallback: str, budget: float,
+                         on_complete: Optional[Callable[[str], None]] = None,
+                         stall_timeout: float = 15.0,
+                         on_source: Optional[Callable[[str], None]] = None,
+                         cancel_event: Optional[threading.Event] = None,
+                         timeout: Optional[float] = None) -> Iterator[str]:
+    """
+    Race a streaming LLM call against a latency budget.
+
+    The stream is consumed on a background thread. If its first fragment
+    arrives within `budget` seconds the fragments are passed through;
+    otherwise (or if it ends empty) `fallback` is yielded at once. Either
+    way the LLM call runs to completion in the background and
+    `on_complete` receives its full text, e.g. to refresh a BlessingBank.
+    `on_source` is told "llm" or "bank" before the first fragment, so the
+    caller can keep a stand-in blessing out of long-lived caches.
+    Setting `cancel_event`, or passing `timeout` seconds, ends the stream
+    where it is and closes the LLM call; a cut-short text is not recorded.
+    """
+    fragments = queue.Queue()
+    stop = threading.Event()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def consume():
+        text = ""
+        stream = stream_factory()
+        try:
+            for fragment in stream:
+                if stop.is_set():
+                    break
+                text += fragment
+                fragments.put(fragment)
+        except Exception as e:
+            print(f"Blessing stream failed: {str(e)}")
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+            fragments.put(_DONE)
+        if stop.is_set():
+            return
+        if text.strip() and on_complete is not None:
+            try:
+                on_complete(text)
+            except Exception as e:
+                print(f"Failed to record blessing: {str(e)}")
+
+    # Copy the context so the LLM's spans carry the caller's request id
+    threading.Thread(target=contextvars.copy_context().run, args=(consume,), name="blessing-stream",
+                     daemon=True).start()
+
+    def next_fragment(wait):
+        """The next fragment, or _DONE once the stream ends, stalls for `wait`
+        seconds, is cancelled or passes its deadline (the last two set `stop`)"""
+        until = time.monotonic() + wait
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                stop.set()
+                return _DONE
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                stop.set()
+                return _DONE
+            if now >= until:
+                return _DONE
+            wake = until if deadline is None else min(until, deadline)
+            try:
+                return fragments.get(timeout=min(_POLL, max(0.0, wake - now)))
+            except queue.Empty:
+                pass
+
+    first = next_fragment(budget)
+    if first is _DONE:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        if on_source is not None:
+            on_source("bank")
+        yield fallback
+        return
+    if on_source is not None:
+        on_source("llm")
+    yield first
+    while True:
+        fragment = next_fragment(stall_timeout)
+        if fragment is _DONE:
+            return
+        yield fragment
@@ -0,0 +1,426 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Optional, Tuple
+
+from utils.tracing import current_span
+
+# (connect, read) seconds per upstream; a deadline in scope can only shorten them
+TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "pollinations": (5, 90),
+    "together": (5, 30),
+    "translate": (3, 10),
+    "imgur": (5, 30),
+    "telegram": (5, 30),
+}
+DEFAULT_TIMEOUT = (5, 30)
+
+# Statuses worth another attempt; other 4xx are the caller's problem
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Hedge delay used until an upstream has enough latency samples for a p95
+HEDGE_AFTER = float(os.getenv("POLLINATIONS_HEDGE_AFTER", "20"))
+HEDGE_MIN_SAMPLES = 20
+
+# Basket deadline of the code running now; copied into worker threads with
+# contextvars.copy_context(), like the request id
+_deadline: ContextVar[Optional["Deadline"]] = ContextVar("deadline", default=None)
+
+
+class UpstreamError(Exception):
+    """Raised instead of sending a request that can't succeed."""
+
+
+class CircuitOpen(UpstreamError):
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"{upstream} is failing, not calling it for another {retry_in:.0f}s")
+        self.upstream = upstream
+
+
+class DeadlineExceeded(UpstreamError):
+    def __init__(self, upstream: str):
+        super().__init__(f"no time left in the request budget to call {upstream}")
+        self.upstream = upstream
+
+
+class Deadline:
+    """Point in time by which a whole basket must be done."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Bound every upstream call inside the block to `seconds` from now.
+
+    Nested deadlines never extend an outer one.
+
+    :return: The Deadline in effect.
+    """
+    outer = _deadline.get()
+    inner = Deadline(seconds)
+    if outer is not None and outer.expires_at < inner.expires_at:
+        inner = outer
+    token = _deadline.set(inner)
+    try:
+        yield inner
+    finally:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            pass  # a generator closed from another context
+
+
+def time_left(upstream: str, limit: float) -> float:
+    """
+    `limit` seconds, shortened to what is left of the deadline in scope.
+
+    :raises DeadlineExceeded: If the deadline has already passed.
+    """
+    current = _deadline.get()
+    if current is None:
+        return limit
+    if current.expired():
+        raise DeadlineExceeded(upstream)
+    return min(limit, current.remaining())
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `threshold` failures in a row.
+
+    Calls fail fast for `cooldown` seconds; after that one trial call is let
+    through, and its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, name: str, threshold: int = 5, cooldown: float = 30):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None  # token of the trial call in flight, if any
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def before_call(self):
+        """
+        Let a call through, or reject it while the upstream is considered down.
+
+        :return: A token if this call is the half-open trial, else None; pass it
+                 to release() once the call is over, whatever its outcome.
+        :raises CircuitOpen: While the upstream is considered down.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            waited = time.monotonic() - self.opened_at
+            if waited >= self.cooldown and self._trial is None:
+                self._trial = object()
+                return self._trial
+            self.rejected += 1
+            retry_in = max(0.0, self.cooldown - waited)
+        raise CircuitOpen(self.name, retry_in)
+
+    def release(self, trial):
+        """
+        End a call that recorded neither success nor failure, e.g. one cut short
+        by the deadline or answered 429; a trial that said nothing about the
+        upstream's health lets the next call be the trial.
+        """
+        if trial is None:
+            return
+        with self._lock:
+            if self._trial is trial:
+                self._trial = None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial is not None or (self.opened_at is None and self.failures >= self.threshold):
+                self.opened += 1
+                self.opened_at = time.monotonic()
+                self._trial = None
+                print(f"Circuit for {self.name} opened after {self.failures} failures")
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(upstream: str) -> CircuitBreaker:
+    """The process-wide circuit breaker of an upstream, shared by sync and async clients."""
+    with _breakers_lock:
+        if upstream not in _breakers:
+            _breakers[upstream] = CircuitBreaker(upstream)
+        return _breakers[upstream]
+
+
+class LatencyTracker:
+    """Recent time-to-headers samples of one upstream, for choosing a hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+class HttpClient:
+    """
+    The one HTTP session every integration shares.
+
+    Adds what plain requests calls lack: a timeout on every request, capped
+    by the basket deadline in scope; jittered retries of connection errors
+    and 429/5xx answers; a circuit breaker per upstream; and, for idempotent
+    GETs, hedging: if no answer arrives within the upstream's p95 latency, a
+    duplicate request is sent and whichever answers first wins.
+    """
+
+    def __init__(self, pool_size: int = 32):
+        # requests is loaded with the first client, not when app.py imports deadline()
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(TIMEOUTS) + 2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        # Hedged requests and their duplicates run here, and losers finish here
+        # (requests can't abort a request in flight). Sized for both copies on
+        # every pooled connection, so a primary never queues and a duplicate is
+        # sent on time; threads are only started when needed.
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="http-hedge")
+        self.retries = 0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def _timeout(self, upstream: str, timeout) -> Tuple[float, float]:
+        connect, read = timeout if isinstance(timeout, tuple) else \
+            (DEFAULT_TIMEOUT[0], timeout) if timeout else TIMEOUTS.get(upstream, DEFAULT_TIMEOUT)
+        read = time_left(upstream, read)
+        return min(connect, read), read
+
+    def _tracker(self, upstream: str) -> LatencyTracker:
+        with self._lock:
+            return self._latency.setdefault(upstream, LatencyTracker())
+
+    def _send(self, method: str, url: str, upstream: str, timeout, latency_key=None, **kwargs):
+        """One attempt, through the upstream's breaker."""
+        circuit = breaker(upstream)
+        # Checked before the breaker, so an expired deadline never takes the half-open trial
+        timeout = self._timeout(upstream, timeout)
+        trial = circuit.before_call()
+        started = time.monotonic()
+        try:
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except self._requests.exceptions.RequestException:
+                circuit.record_failure()
+                raise
+            if response.status_code >= 500:
+                circuit.record_failure()
+            else:
+                circuit.record_success()
+                self._tracker(latency_key or upstream).add(time.monotonic() - started)
+            return response
+        finally:
+            circuit.release(trial)
+
+    def request(self, method: str, url: str, upstream: str, retries: int = 2, backoff: float = 0.5,
+                timeout=None, latency_key: str = None, **kwargs):
+        """
+        Send a request, retrying connection errors and RETRY_STATUSES.
+
+        :param upstream: Key of the upstream's timeouts, breaker and latency stats.
+        :param retries: Extra attempts after the first; only made if the deadline allows.
+        :param timeout: Read timeout in seconds or a (connect, read) tuple; defaults to TIMEOUTS.
+        :param latency_key: Groups the latency stats of requests with similar response
+                            times, e.g. per model; defaults to `upstream`.
+        :return: The response of the last attempt, whatever its status.
+        :raises UpstreamError: If the breaker is open or the deadline has passed.
+        :raises requests.exceptions.RequestException: If the last attempt failed to connect or read.
+        """
+        for attempt in range(retries + 1):
+            try:
+                response = self._send(method, url, upstream, timeout, latency_key, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == retries:
+                    return response
+                retry_after = response.headers.get("Retry-After")
+                response.close()
+            except self._requests.exceptions.RequestException:
+                if attempt == retries:
+                    raise
+                retry_after = None
+
+            # Full jitter, so clients that failed together don't retry together
+            delay = random.uniform(0, backoff * 2 ** attempt)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            current = _deadline.get()
+            if current is not None and delay >= current.remaining():
+                raise DeadlineExceeded(upstream)
+            with self._lock:
+                self.retries += 1
+            stage = current_span()
+            if stage is not None:
+                stage.add_retry()
+            time.sleep(delay)
+
+    def get(self, url: str, upstream: str, hedge: bool = False, hedge_slots: threading.Semaphore = None,
+            **kwargs):
+        """
+        GET with retries; with `hedge`, also races a duplicate request.
+
+        Only hedge idempotent requests whose answer doesn't depend on which
+        copy is served (Pollinations with a fixed seed). The duplicate is sent
+        after the upstream's p95 time-to-headers (HEDGE_AFTER until there are
+        enough samples), so about one request in twenty is doubled.
+
+        :param hedge_slots: Semaphore limiting the caller's requests in flight; the
+                            duplicate is only sent if it can take a slot without
+                            waiting, held until both copies have answered.
+        """
+        if not hedge:
+            return self.request("GET", url, upstream, **kwargs)
+
+        delay = self._tracker(kwargs.get("latency_key") or upstream).p95() or HEDGE_AFTER
+        context = contextvars.copy_context()
+        primary = self._hedge_executor.submit(context.run, self.request, "GET", url, upstream, **kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or breaker(upstream).state != "closed":
+            return primary.result()
+        if hedge_slots is not None and not hedge_slots.acquire(blocking=False):
+            return primary.result()
+
+        with self._lock:
+            self.hedges += 1
+        stage = current_span()
+        if stage is not None:
+            stage.set(hedged=True)
+        duplicate = self._hedge_executor.submit(contextvars.copy_context().run, self.request, "GET", url,
+                                                upstream, **kwargs)
+        if hedge_slots is not None:
+            _release_when_done([primary, duplicate], hedge_slots)
+        pending = {primary, duplicate}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if response.status_code >= 400 and pending:
+                    response.close()  # the other copy may still succeed
+                    error = error or self._requests.exceptions.HTTPError(f"HTTP {response.status_code}",
+                                                                          response=response)
+                    continue
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                if future is duplicate:
+                    with self._lock:
+                        self.hedges_won += 1
+                    if stage is not None:
+                        stage.set(hedge_won=True)
+                return response
+        raise error
+
+
+def _release_when_done(futures, slots: threading.Semaphore):
+    """Give back one slot once every future has finished; the loser is closed by then."""
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            slots.release()
+
+    for future in futures:
+        future.add_done_callback(done)
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Process-wide client, so every session and integration shares one connection pool."""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
+
+
+def stats() -> dict:
+    """
+    Retry and hedge counters of the shared client, and each breaker's state
+    (0 closed, 1 half open, 2 open); cheap to call before any request was made.
+    """
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    values = {}
+    client = _shared_client
+    if client is not None:
+        with client._lock:
+            values.update(retries=client.retries, hedges=client.hedges, hedges_won=client.hedges_won)
+    with _breakers_lock:
+        circuits = dict(_breakers)
+    for name, circuit in circuits.items():
+        values[f"circuit_{name}_state"] = states[circuit.state]
+        values[f"circuit_{name}_opened"] = circuit.opened
+        values[f"circuit_{name}_rejected"] = circuit.rejected
+    return values
@@ -0,0 +1,197 @@
+import os
+import math
+import hashlib
+import threading
+from typing import Iterable
+
+MAGIC = b"HLL1"
+
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch.
+
+    Estimates the number of distinct items with a standard error of about
+    1.04 / sqrt(m) using m one-byte registers, so memory is fixed by the
+    chosen error bound and independent of how many items are added.
+    """
+
+    def __init__(self, error_rate: float = 0.01, precision: int = None):
+        if precision is None:
+            precision = math.ceil(math.log2((1.04 / error_rate) ** 2))
+        self.p = max(4, min(18, precision))
+        self.m = 1 << self.p
+        self.registers = bytearray(self.m)
+
+    @property
+    def error_rate(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item.
+
+        :return: True if the sketch changed (the item may be new).
+        """
+        h = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def count(self) -> int:
+        """Estimated number of distinct items added."""
+        m = self.m
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # small-range (linear counting) correction
+        return int(round(estimate))
+
+    def merge(self, other: "HyperLogLog") -> bool:
+        """
+        Fold another sketch of the same precision into this one.
+
+        :return: True if this sketch changed.
+        """
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge sketches of precision {self.p} and {other.p}")
+        changed = False
+        for i, r in enumerate(other.registers):
+            if r > self.registers[i]:
+                self.registers[i] = r
+                changed = True
+        return changed
+
+    def to_bytes(self) -> bytes:
+        return MAGIC + bytes([self.p]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        if data[:4] != MAGIC or len(data) != 5 + (1 << data[4]):
+            raise ValueError("Not a HyperLogLog sketch")
+        sketch = cls(precision=data[4])
+        sketch.registers[:] = data[5:]
+        return sketch
+
+    @classmethod
+    def load(cls, path: str) -> "HyperLogLog":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class HyperLogLogCounter:
+    """
+    Approximate unique-user counter with the same interface as UserRegistry.
+
+    The sketch lives in a small fixed-size file (a few KB for 1% error).
+    Writes merge with the file's current content before an atomic replace,
+    so processes sharing the file never lose each other's registers for
+    long. Sketch files of other app replicas listed in `peer_paths` are
+    merged into the reported count.
+
+    An existing file keeps its precision even if `error_rate` asks for
+    another, and a file that can't be merged is never overwritten, so a
+    configuration change can't wipe the recorded users.
+    """
+
+    def __init__(self, path: str = "users.hll", error_rate: float = 0.01, peer_paths: Iterable[str] = ()):
+        self.path = path
+        self.peer_paths = [p for p in peer_paths if p and p != path]
+        self.sketch = HyperLogLog(error_rate)
+        try:
+            stored = HyperLogLog.load(path)
+            if stored.p != self.sketch.p:
+                print(f"Keeping the {stored.error_rate:.2%} error rate of {path} instead of {error_rate:.2%}")
+                self.sketch = HyperLogLog(precision=stored.p)
+        except (OSError, ValueError):
+            pass  # no file yet, or unreadable: reported and left alone by _refresh_own
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        self._peers = {}
+        self._cached_count = None
+        with self._lock:
+            self._refresh_own()
+
+    def _changed_on_disk(self, path: str) -> bool:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if self._mtimes.get(path) == mtime:
+            return False
+        self._mtimes[path] = mtime
+        return True
+
+    def _refresh_own(self) -> bool:
+        """
+        Merge the file's registers if it changed.
+
+        :return: False if the file exists but can't be merged, so it must not be overwritten.
+        """
+        if not self._changed_on_disk(self.path):
+            return True
+        try:
+            if self.sketch.merge(HyperLogLog.load(self.path)):
+                self._cached_count = None
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable sketch {self.path}: {str(e)}")
+            return False
+        return True
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.sketch.to_bytes())
+        os.replace(tmp_path, self.path)
+        self._changed_on_disk(self.path)
+
+    def register(self, user_id: str) -> int:
+        """
+        Record a user.
+
+        :return: Estimated total number of unique users across all replicas.
+        """
+        with self._lock:
+            if self.sketch.add(user_id):
+                self._cached_count = None
+                self._mtimes.pop(self.path, None)  # force a re-read before writing
+                if not self._refresh_own():
+                    print(f"Not saving the user sketch over {self.path}")
+                else:
+                    try:
+                        self._save()
+                    except OSError as e:
+                        print(f"Failed to save user sketch: {str(e)}")
+        return self.count()
+
+    def count(self) -> int:
+        """Estimated total number of unique users across all replicas."""
+        with self._lock:
+            self._refresh_own()
+            for path in self.peer_paths:
+                if self._changed_on_disk(path):
+                    try:
+                        peer = HyperLogLog.load(path)
+                        if peer.p != self.sketch.p:
+                            raise ValueError(f"precision {peer.p}, not {self.sketch.p}")
+                        self._peers[path] = peer
+                        self._cached_count = None
+                    except (OSError, ValueError) as e:
+                        print(f"Ignoring unreadable sketch {path}: {str(e)}")
+            if self._cached_count is None:
+                total = HyperLogLog(precision=self.sketch.p)
+                total.merge(self.sketch)
+                for peer in self._peers.values():
+                    total.merge(peer)
+                self._cached_count = total.count()
+            return self._cached_count
+
+    def __contains__(self, user_id: str) -> bool:
+        raise TypeError("HyperLogLogCounter only estimates counts; use UserRegistry for membership")
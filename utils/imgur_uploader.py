@@ -1,24 +1,68 @@
 import os
 import base64
+import threading
+import contextvars
 import requests
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Union, Literal, List, Tuple
 from dotenv import load_dotenv
 
+from utils.tracing import span
+from utils.http_client import get_http_client, UpstreamError
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Returned instead of raising when an upload fails
+IMGUR_FALLBACK_URL = "https://i.ibb.co/wWFYPtQ/no-image.png"
+IMGUR_UPLOAD_URL = os.getenv("IMGUR_UPLOAD_URL", "https://api.imgur.com/3/upload")
+
 class ImgurUploader:
-    def __init__(self, client_id: str = None, max_retries: int = 3, timeout: int = 10, max_workers: int = 5):
+    def __init__(self, client_id: str = None, max_retries: int = 3, timeout: int = 10, max_workers: int = 5,
+                 backoff: float = 1.0):
         self.imgur_client_id = client_id or os.getenv("IMGUR_CLIENT_ID")
         if not self.imgur_client_id:
             raise ValueError("Imgur Client-ID not found. Please provide it or set it in the environment variables.")
         
-        self.session = requests.Session()
-        self.session.headers.update({'Authorization': f'Client-ID {self.imgur_client_id}'})
+        # Connections come from the shared keep-alive pool of utils.http_client
+        self.headers = {'Authorization': f'Client-ID {self.imgur_client_id}'}
         self.max_retries = max_retries
         self.timeout = timeout
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imgur")
+
+    def upload_bytes(
+        self, media_bytes: bytes, media_type: Literal["image", "video"],
+        title: str = "AI Generated Media",
+        description: str = "This media was generated by an AI model"
+    ) -> str:
+        """
+        Uploads raw media bytes to Imgur as a multipart file, avoiding the
+        33% size overhead of base64.
+
+        :param media_bytes: The encoded image or video.
+        :param media_type: Type of media, either "image" or "video".
+        :param title: Title for the media.
+        :param description: Description for the media.
+        :return: URL of the uploaded media, or IMGUR_FALLBACK_URL if upload fails.
+        """
+        payload = {'type': 'file', 'title': title, 'description': description}
+        files = {media_type: (f"upload.{'mp4' if media_type == 'video' else 'img'}", media_bytes)}
+        return self._execute_with_retry(IMGUR_UPLOAD_URL, payload, files)
+
+    def upload_async(
+        self, media_bytes: bytes, media_type: Literal["image", "video"],
+        title: str = "AI Generated Media",
+        description: str = "This media was generated by an AI model"
+    ) -> Future:
+        """
+        Same as upload_bytes, but runs on the uploader's thread pool.
+
+        :return: Future resolving to the uploaded media URL.
+        """
+        # Carry the caller's request id over to the pool thread
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self.upload_bytes, media_bytes, media_type, title, description)
 
     def upload_media_to_imgur(
         self, media_base64: str, media_type: Literal["image", "video"], 
@@ -43,38 +87,65 @@ class ImgurUploader:
             'video': media_base64 if media_type == "video" else None
         }
 
-        return self._execute_with_retry("https://api.imgur.com/3/upload", payload)
+        return self._execute_with_retry(IMGUR_UPLOAD_URL, payload)
 
-    def _execute_with_retry(self, url: str, payload: dict) -> str:
+    def _execute_with_retry(self, url: str, payload: dict, files: dict = None) -> str:
         # print(payload)
-        for attempt in range(self.max_retries):
+        with span("imgur.upload") as stage:
+            upload_size = sum(len(f[1]) for f in (files or {}).values()) or \
+                sum(len(v) for v in payload.values() if isinstance(v, str))
             try:
-                response = self.session.post(url, data=payload, timeout=self.timeout)
+                # Jittered backoff between attempts; Retry-After is honoured on 429
+                response = get_http_client().request(
+                    "POST", url, "imgur", retries=self.max_retries - 1, backoff=self.backoff,
+                    timeout=self.timeout, data=payload, files=files, headers=self.headers,
+                )
                 response.raise_for_status()
-                return response.json().get('data', {}).get('link', "https://i.ibb.co/wWFYPtQ/no-image.png")
-            except requests.exceptions.RequestException as e:
-                if attempt == self.max_retries - 1:
-                    print(f"Upload failed after {self.max_retries} attempts.")
-                    return "https://i.ibb.co/wWFYPtQ/no-image.png"
-                print(f"Attempt {attempt + 1} failed. Retrying...")
-
-    def upload_multiple(self, media_list: List[Tuple[str, Literal["image", "video"], str, str]]) -> List[str]:
+                stage.add_bytes_in(len(response.content))
+                return response.json().get('data', {}).get('link', IMGUR_FALLBACK_URL)
+            except (requests.exceptions.RequestException, UpstreamError) as e:
+                print(f"Upload failed after {stage.retries + 1} attempts: {str(e)}")
+                stage.fail(e)
+                return IMGUR_FALLBACK_URL
+            finally:
+                stage.add_bytes_out(upload_size * (stage.retries + 1))
+
+    def upload_multiple(self, media_list: List[Tuple[Union[bytes, str], Literal["image", "video"], str, str]]) -> List[str]:
         """
         Uploads multiple media items to Imgur concurrently.
 
-        :param media_list: List of tuples (media_base64, media_type, title, description)
+        :param media_list: List of tuples (media, media_type, title, description), where
+                           media is raw bytes (sent as multipart) or a base64 string
         :return: List of URLs of the uploaded media
         """
         futures = [
-            self.executor.submit(self.upload_media_to_imgur, media, media_type, title, description)
+            self.executor.submit(
+                self.upload_bytes if isinstance(media, bytes) else self.upload_media_to_imgur,
+                media, media_type, title, description,
+            )
             for media, media_type, title, description in media_list
         ]
         return [future.result() for future in futures]
 
-    def __del__(self):
-        self.session.close()
+    def close(self):
         self.executor.shutdown(wait=False)
 
+
+_shared_uploader = None
+_shared_lock = threading.Lock()
+
+
+def get_imgur_uploader() -> ImgurUploader:
+    """
+    Process-wide uploader, so every session shares one connection pool and
+    one worker pool instead of building (and tearing down) its own.
+    """
+    global _shared_uploader
+    with _shared_lock:
+        if _shared_uploader is None:
+            _shared_uploader = ImgurUploader()
+        return _shared_uploader
+
 # Example usage
 if __name__ == "__main__":
     uploader = ImgurUploader()
@@ -0,0 +1,162 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from utils.tracing import span
+from utils.http_client import breaker, time_left, TIMEOUTS
+
+SEED_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "translations.json")
+CACHE_FILE = os.path.join(".cache", "translations.json")
+# Overrides deep_translator's Google endpoint, e.g. to point at a local stand-in
+GOOGLE_TRANSLATE_URL = os.getenv("GOOGLE_TRANSLATE_URL")
+
+# Used only when a batched request can't be split back into items
+_FALLBACK_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="translate")
+# deep_translator calls requests without a timeout, so its calls run here
+# and callers stop waiting for them after the translate timeout
+_REQUEST_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="translate-request")
+
+
+def _google_translator():
+    from deep_translator import GoogleTranslator
+    translator = GoogleTranslator(source='auto', target='en')
+    if GOOGLE_TRANSLATE_URL:
+        translator._base_url = GOOGLE_TRANSLATE_URL
+    return translator
+
+
+def _google_translate(text: str) -> str:
+    """
+    Translate through Google, under the "translate" circuit breaker.
+
+    :raises concurrent.futures.TimeoutError: If no answer came within the timeout (or the basket deadline).
+    """
+    circuit = breaker("translate")
+    timeout = time_left("translate", TIMEOUTS["translate"][1])
+    trial = circuit.before_call()
+    future = _REQUEST_EXECUTOR.submit(lambda: _google_translator().translate(text))
+    try:
+        translated = future.result(timeout=timeout)
+    except Exception:
+        circuit.record_failure()
+        raise
+    else:
+        circuit.record_success()
+    finally:
+        circuit.release(trial)
+    return translated
+
+
+def normalize_item(item: str) -> str:
+    """Canonical cache key for a basket item: trimmed, single-spaced."""
+    return " ".join(item.split())
+
+
+class ItemTranslator:
+    """
+    Hebrew -> English translation of basket items.
+
+    Lookups go to the shipped seed dictionary (every preset and icon-grid
+    item) first, then to an on-disk LRU cache of earlier translations. All
+    misses of one request are translated in a single network call.
+    """
+
+    def __init__(self, seed_file: str = SEED_FILE, cache_file: str = CACHE_FILE, max_entries: int = 5000):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._seed = self._load_json(seed_file)
+        self._cache = OrderedDict(self._load_json(cache_file))
+
+    @staticmethod
+    def _load_json(path: str) -> Dict[str, str]:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return {normalize_item(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_file)
+
+    def _lookup(self, key: str):
+        if key in self._seed:
+            return self._seed[key]
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    @staticmethod
+    def _translate_one(item: str) -> str:
+        try:
+            return _google_translate(item)
+        except Exception:
+            return item  # fallback
+
+    def _translate_misses(self, misses: List[str]) -> List[str]:
+        # One request for the whole batch: items go out newline-separated and
+        # come back in the same order.
+        if len(misses) > 1:
+            try:
+                translated = _google_translate("\n".join(misses))
+                lines = [line.strip() for line in (translated or "").split("\n")]
+                if len(lines) == len(misses) and all(lines):
+                    return lines
+            except Exception as e:
+                print(f"Batched translation failed: {str(e)}")
+        return list(_FALLBACK_EXECUTOR.map(self._translate_one, misses))
+
+    def translate_many(self, items: List[str]) -> List[str]:
+        """
+        Translate basket items to English.
+
+        :param items: Hebrew item names.
+        :return: English names in the same order; untranslatable items are returned as-is.
+        """
+        keys = [normalize_item(item) for item in items]
+        with self._lock:
+            found = {key: self._lookup(key) for key in keys}
+        misses = [key for key in dict.fromkeys(keys) if key and found[key] is None]
+
+        if misses:
+            with span("translate", items=len(keys), misses=len(misses)) as stage:
+                stage.add_bytes_out(sum(len(key.encode("utf-8")) for key in misses))
+                for key, translated in zip(misses, self._translate_misses(misses)):
+                    found[key] = translated
+                failed = sum(1 for key in misses if found[key] == key)
+                if failed:
+                    stage.fail(f"{failed} of {len(misses)} items left untranslated", outcome="partial")
+            with self._lock:
+                for key in misses:
+                    if found[key] != key:  # don't cache failed translations
+                        self._cache[key] = found[key]
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+                try:
+                    self._save()
+                except OSError as e:
+                    print(f"Failed to save translation cache: {str(e)}")
+
+        return [found[key] or item for key, item in zip(keys, items)]
+
+
+_shared_translator = None
+_shared_lock = threading.Lock()
+
+
+def get_item_translator() -> ItemTranslator:
+    """Process-wide translator, so the caches are loaded once, not per rerun."""
+    global _shared_translator
+    with _shared_lock:
+        if _shared_translator is None:
+            _shared_translator = ItemTranslator()
+        return _shared_translator
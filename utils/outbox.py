@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import heapq
+import random
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from utils.tracing import span, request_context, current_request_id, current_user_id
+
+OUTBOX_DIR = os.path.join(".cache", "outbox")
+
+
+class Outbox:
+    """
+    Durable queue for side effects that must not delay the user.
+
+    Jobs are written to disk before `enqueue` returns and drained by a pool
+    of background worker threads. A handler that raises is retried with
+    jittered exponential backoff; after `max_attempts` the job is parked in
+    failed/. Jobs still pending when the process stops are picked up again
+    on the next start, so delivery is at-least-once.
+
+    Layout under `root`: pending/<id>.json (+ blobs/<id>.bin for binary
+    payloads), done/<id>.json with the handler's result, failed/<id>.json.
+    """
+
+    def __init__(self, root: str = OUTBOX_DIR, workers: int = 4, max_attempts: int = 8,
+                 base_delay: float = 2.0, max_delay: float = 300.0, keep_results: float = 86400):
+        self.root = root
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.keep_results = keep_results
+        self._handlers: Dict[str, Callable] = {}
+        self._queue = []  # heap of (due_time, job_id)
+        self._cond = threading.Condition()
+        self._started = False
+        for sub in ("pending", "blobs", "done", "failed"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    def _path(self, sub: str, job_id: str, ext: str = "json") -> str:
+        return os.path.join(self.root, sub, f"{job_id}.{ext}")
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def register(self, kind: str, handler: Callable):
+        """
+        Register the handler for a job kind.
+
+        :param handler: Called as handler(payload, blob); returns a JSON-serializable
+                        result or raises to have the job retried. It may instead
+                        return a concurrent.futures.Future of the result: the worker
+                        moves on at once and the job completes (or is retried) when
+                        the future does, so slow deliveries never hold a worker and
+                        are never sent again while still pending.
+        """
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Reload jobs left pending by a previous process and start the workers."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            now = time.time()
+            for name in os.listdir(os.path.join(self.root, "pending")):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.root, "pending", name), encoding="utf-8") as f:
+                        job = json.load(f)
+                    heapq.heappush(self._queue, (job.get("next_attempt_at", now), job["id"]))
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Skipping unreadable outbox job {name}: {str(e)}")
+        self._prune_results()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"outbox-{i}", daemon=True).start()
+
+    def enqueue(self, kind: str, payload: dict, blob: Optional[bytes] = None) -> str:
+        """
+        Persist a job and schedule it for immediate delivery.
+
+        :return: Job id, to look up the outcome with result().
+        """
+        job_id = uuid.uuid4().hex
+        if blob is not None:
+            with open(self._path("blobs", job_id, "bin"), "wb") as f:
+                f.write(blob)
+        now = time.time()
+        job = {"id": job_id, "kind": kind, "payload": payload, "has_blob": blob is not None,
+               "attempts": 0, "created_at": now, "next_attempt_at": now,
+               "user_id": current_user_id(), "request_id": current_request_id()}
+        self._write_json(self._path("pending", job_id), job)
+        with self._cond:
+            heapq.heappush(self._queue, (now, job_id))
+            self._cond.notify()
+        return job_id
+
+    def result(self, job_id: str) -> Optional[dict]:
+        """
+        :return: {'status': 'done', 'result': ...} or {'status': 'failed', 'error': ...}
+                 once the job finished, None while it is still pending.
+        """
+        for status in ("done", "failed"):
+            try:
+                with open(self._path(status, job_id), encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def failed_attempts(self, job_id: str) -> int:
+        """
+        :return: How many attempts of a still pending job have failed so far
+                 (each is recorded with its retry); 0 for a job not pending.
+        """
+        try:
+            with open(self._path("pending", job_id), encoding="utf-8") as f:
+                return json.load(f)["attempts"]
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.time():
+                    timeout = self._queue[0][0] - time.time() if self._queue else None
+                    self._cond.wait(timeout)
+                _, job_id = heapq.heappop(self._queue)
+            self._run(job_id)
+
+    def _run(self, job_id: str):
+        pending_path = self._path("pending", job_id)
+        blob_path = self._path("blobs", job_id, "bin")
+        try:
+            with open(pending_path, encoding="utf-8") as f:
+                job = json.load(f)
+            blob = None
+            if job.get("has_blob"):
+                with open(blob_path, "rb") as f:
+                    blob = f.read()
+        except (OSError, ValueError) as e:
+            print(f"Dropping unreadable outbox job {job_id}: {str(e)}")
+            return
+
+        job["attempts"] += 1
+        try:
+            # Spans of the delivery belong to the request that enqueued it
+            with request_context(job.get("user_id"), job.get("request_id")), \
+                    span(f"outbox.{job['kind']}", attempt=job["attempts"],
+                         queued_s=round(time.time() - job["created_at"], 3)) as stage:
+                stage.add_bytes_out(len(blob) if blob else 0)
+                handler = self._handlers[job["kind"]]
+                result = handler(job["payload"], blob)
+        except Exception as e:
+            self._failed(job, e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._settle(job, future))
+            return
+        self._finish(job_id, "done", {"status": "done", "result": result})
+
+    def _settle(self, job: dict, future: Future):
+        """Complete a job whose handler returned a future, from the future's callback."""
+        error = future.exception()
+        if error is not None:
+            self._failed(job, error)
+            return
+        self._finish(job["id"], "done", {"status": "done", "result": future.result()})
+
+    def _failed(self, job: dict, error: BaseException):
+        """Schedule a retry with backoff, or park the job in failed/ once out of attempts."""
+        job_id = job["id"]
+        if job["attempts"] >= self.max_attempts or job["kind"] not in self._handlers:
+            print(f"Outbox job {job['kind']} {job_id} failed permanently: {str(error)}")
+            self._finish(job_id, "failed", {"status": "failed", "error": str(error)})
+            return
+        delay = min(self.max_delay, self.base_delay * 2 ** (job["attempts"] - 1))
+        delay *= random.uniform(0.5, 1.0)
+        print(f"Outbox job {job['kind']} {job_id} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {str(error)}")
+        job["next_attempt_at"] = time.time() + delay
+        self._write_json(self._path("pending", job_id), job)
+        with self._cond:
+            heapq.heappush(self._queue, (job["next_attempt_at"], job_id))
+            self._cond.notify()
+
+    def _finish(self, job_id: str, status: str, record: dict):
+        self._write_json(self._path(status, job_id), record)
+        for path in (self._path("pending", job_id), self._path("blobs", job_id, "bin")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _prune_results(self):
+        cutoff = time.time() - self.keep_results
+        for status in ("done", "failed"):
+            directory = os.path.join(self.root, status)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,68 @@
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+from PIL import Image, ImageOps
+
+# Refuse anything larger before decoding a single pixel (~ a 48MP phone photo)
+MAX_UPLOAD_PIXELS = 50_000_000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 32
+
+
+class PhotoTooLarge(ValueError):
+    pass
+
+
+def _decode_reduced(data: bytes, box: Tuple[int, int]) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    width, height = img.size
+    if width * height > MAX_UPLOAD_PIXELS:
+        raise PhotoTooLarge(f"התמונה גדולה מדי ({width}x{height})")
+    # Orientation swaps the axes, so reduce against the larger side only
+    side = max(box)
+    # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale directly
+    img.draft("RGB", (side * 2, side * 2))
+    img = ImageOps.exif_transpose(img)
+    # Other formats: reduce in integer steps before the final resample
+    img.thumbnail((side * 2, side * 2), reducing_gap=2.0)
+    return img
+
+
+def prepare_photo(data: bytes, size: Tuple[int, int], exact: bool = True) -> Image.Image:
+    """
+    Decode an uploaded photo straight to thumbnail size.
+
+    JPEGs are decoded in draft mode at a reduced scale, EXIF orientation is
+    applied, and uploads above MAX_UPLOAD_PIXELS are rejected before they
+    are decoded. Results are cached per (content hash, size, exact), so
+    Streamlit reruns never decode the same upload twice. The returned image
+    is shared: paste it, don't draw on it.
+
+    :param size: Target (width, height).
+    :param exact: Resize to exactly `size`; otherwise fit inside it keeping the aspect ratio.
+    :return: RGBA image.
+    :raises PhotoTooLarge: If the upload exceeds MAX_UPLOAD_PIXELS.
+    """
+    key = (hashlib.sha256(data).hexdigest(), tuple(size), exact)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    img = _decode_reduced(data, size)
+    if exact:
+        img = img.resize(size, Image.LANCZOS)
+    else:
+        img.thumbnail(size, Image.LANCZOS)
+    img = img.convert("RGBA")
+
+    with _cache_lock:
+        _cache[key] = img
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return img
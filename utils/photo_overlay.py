@@ -0,0 +1,52 @@
+from functools import lru_cache
+from typing import Tuple
+
+from PIL import Image, ImageDraw
+
+PHOTO_RADIUS = 28
+SHADOW_RADIUS = 32
+SHADOW_OFFSET = 6
+SHADOW_ALPHA = 60
+
+
+@lru_cache(maxsize=32)
+def rounded_mask(size: Tuple[int, int], radius: int) -> Image.Image:
+    """Rounded-rectangle alpha mask, cached per (size, radius). Shared: don't draw on it."""
+    width, height = size
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle([0, 0, width, height], radius=radius, fill=255)
+    return mask
+
+
+@lru_cache(maxsize=32)
+def shadow_layer(size: Tuple[int, int], radius: int = SHADOW_RADIUS, offset: int = SHADOW_OFFSET,
+                 alpha: int = SHADOW_ALPHA) -> Image.Image:
+    """Soft drop shadow for a photo of `size`, cached. Shared: don't draw on it."""
+    width, height = size
+    shadow = Image.new("RGBA", (width + 2 * offset, height + 2 * offset), (0, 0, 0, 0))
+    ImageDraw.Draw(shadow).rounded_rectangle(
+        [offset, offset, width + offset, height + offset], radius=radius, fill=(0, 0, 0, alpha)
+    )
+    return shadow
+
+
+def overlay_photo(canvas: Image.Image, photo: Image.Image, position: Tuple[int, int],
+                  radius: int = PHOTO_RADIUS):
+    """
+    Paste a photo with rounded corners and a drop shadow onto the canvas.
+
+    Only the region under the photo and its shadow is composited, so the
+    cost depends on the photo size, not the canvas size; masks and shadows
+    come from the caches above. `photo` is not modified.
+    """
+    x, y = position
+    shadow = shadow_layer(photo.size)
+    # The shadow sits SHADOW_OFFSET down and right of the photo
+    left, top = x, y
+    right = min(canvas.width, x + SHADOW_OFFSET + shadow.width)
+    bottom = min(canvas.height, y + SHADOW_OFFSET + shadow.height)
+
+    region = canvas.crop((left, top, right, bottom)).convert("RGBA")
+    region.alpha_composite(shadow, dest=(SHADOW_OFFSET, SHADOW_OFFSET))
+    region.paste(photo, (0, 0), rounded_mask(photo.size, radius))
+    canvas.paste(region.convert(canvas.mode), (left, top))
@@ -0,0 +1,140 @@
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait, FIRST_COMPLETED
+
+from utils.tracing import span
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # running outside Streamlit (scripts, benchmarks)
+    add_script_run_ctx = get_script_run_ctx = None
+
+# Shared by every session in the process, so the number of threads talking to
+# upstream services stays bounded no matter how many users are connected.
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="basket-stage")
+
+
+class StageFailed(Exception):
+    """Raised by StageGroup.join when a stage raises or returns no result."""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(f"{stage}: {message}")
+        self.stage = stage
+
+
+class StageTimeout(StageFailed):
+    """Raised by StageGroup.join when a stage misses its deadline."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(stage, f"timed out after {timeout:g}s")
+        self.timeout = timeout
+
+
+def _was_cancelled(future) -> bool:
+    if not future.done():
+        return False
+    return future.cancelled() or isinstance(future.exception(), CancelledError)
+
+
+class StageGroup:
+    """
+    Runs independent pipeline stages concurrently and joins them.
+
+    Each stage is a plain callable with its own timeout. If any stage fails,
+    times out or returns None (the generators' failure value), the remaining
+    stages are cancelled: queued ones never start and running ones can watch
+    `cancel_event` to stop early. A failure sets `cancel_event` as soon as it
+    happens, so work done outside the group (on the caller's thread) can
+    watch it too before join() is reached.
+    """
+
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self._stages = {}
+        # Worker threads need the session's script context for st.* calls
+        self._script_ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx else None
+
+    def submit(self, name: str, fn, *args, timeout: float = 60, **kwargs):
+        """
+        Start a stage on the shared executor.
+
+        :param name: Key of the stage's result in the dict returned by join().
+        :param fn: Callable doing the work.
+        :param timeout: Seconds, counted from now, the stage may run.
+        :return: The stage's Future.
+        """
+        submitted = time.monotonic()
+
+        def run():
+            if self.cancel_event.is_set():
+                raise CancelledError()
+            if self._script_ctx is not None:
+                add_script_run_ctx(threading.current_thread(), self._script_ctx)
+            try:
+                with span(f"stage.{name}", queued_ms=round((time.monotonic() - submitted) * 1000, 1)) as stage:
+                    result = fn(*args, **kwargs)
+                    if result is None:
+                        stage.fail("returned no result")
+                    return result
+            finally:
+                if self._script_ctx is not None:
+                    add_script_run_ctx(threading.current_thread(), None)
+
+        # Copy the caller's context too, so the stage's spans carry its request id
+        future = _EXECUTOR.submit(contextvars.copy_context().run, run)
+        future.add_done_callback(self._on_done)
+        self._stages[name] = (future, time.monotonic() + timeout, timeout)
+        return future
+
+    def _on_done(self, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None or future.result() is None:
+            self.cancel_event.set()
+
+    def join(self) -> dict:
+        """
+        Wait for all stages; total wait is the slowest stage, not the sum.
+
+        :return: Dict mapping stage name to its result.
+        :raises StageFailed: On the first stage to fail; the others are cancelled.
+        """
+        results = {}
+        pending = dict(self._stages)
+        try:
+            while pending:
+                now = time.monotonic()
+                # A stage that failed goes before the ones cancelled because of it
+                for name, (future, deadline, timeout) in sorted(pending.items(),
+                                                                key=lambda item: _was_cancelled(item[1][0])):
+                    if future.done():
+                        try:
+                            result = future.result()
+                        except CancelledError:
+                            raise StageFailed(name, "cancelled")
+                        except Exception as e:
+                            raise StageFailed(name, str(e)) from e
+                        if result is None:
+                            raise StageFailed(name, "returned no result")
+                        results[name] = result
+                        del pending[name]
+                    elif now >= deadline:
+                        raise StageTimeout(name, timeout)
+                if pending:
+                    next_deadline = min(deadline for _, deadline, _ in pending.values())
+                    wait(
+                        [future for future, _, _ in pending.values()],
+                        timeout=max(0.0, next_deadline - time.monotonic()),
+                        return_when=FIRST_COMPLETED,
+                    )
+        except BaseException:
+            self.cancel()
+            raise
+        return results
+
+    def cancel(self):
+        """Signal every stage to stop and drop the ones not yet started."""
+        self.cancel_event.set()
+        for future, _, _ in self._stages.values():
+            future.cancel()
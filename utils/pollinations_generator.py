@@ -1,4 +1,3 @@
-import requests
 from PIL import Image
 import io
 import sys, os
@@ -6,13 +5,18 @@ from urllib.parse import quote
 import base64
 import json
 import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
-from deep_translator import GoogleTranslator
 
 # Add the parent directory of 'text_to_image' (which is 'utils') to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from utils.imgur_uploader import ImgurUploader
+from utils.item_translator import get_item_translator
+from utils.tracing import span
+from utils.http_client import get_http_client, current_deadline, DeadlineExceeded
 
 # https://pollinations.ai/
 ## Parameters
@@ -30,55 +34,215 @@ from utils.imgur_uploader import ImgurUploader
 
 ## Response
 # The API returns a raw image file (typically JPEG or PNG) as the response body. You can directly embed the image in your HTML or Markdown.
+# Image requests this process may have in flight to Pollinations at once,
+# per model, across all sessions and variants, hedged duplicates included;
+# protects the upstream quota.
+# Per model, so quick turbo drafts never queue behind slow flux images.
+MAX_CONCURRENT = int(os.getenv("POLLINATIONS_CONCURRENCY", "4"))
+_UPSTREAM_SLOTS = {}
+_SLOTS_LOCK = threading.Lock()
+# Variant downloads wait here for a slot, off the script thread
+_VARIANT_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="pollinations-variant")
+
 class PollinationsGenerator:
     def __init__(self):
-        self.api_url = "https://image.pollinations.ai/prompt/"
-        
-    def generate_image(self, prompt):
+        self.api_url = os.getenv("POLLINATIONS_API_URL", "https://image.pollinations.ai/prompt/")
+        self.model = "flux"
+        self.seed = 99
+        # The seed makes the image deterministic, so a slow request can safely be raced by a duplicate
+        self.hedge = os.getenv("POLLINATIONS_HEDGE", "1") != "0"
+
+    def build_prompt(self, prompt):
+        """The full English image prompt for comma-separated Hebrew basket items"""
+        # Translate each item to English and emphasize visibility
+        items = [item.strip() for item in prompt.split(',') if item.strip()]
+        items_en = [
+            f"{translated} (clearly visible, in the front)"
+            for translated in get_item_translator().translate_many(items)
+        ]
+        items_english = ', '.join(items_en)
+
+        # Build the improved prompt
+        return (
+            f"A beautiful Shavuot basket on a festive table, containing: {items_english}. "
+            "The basket is overflowing, ultra-realistic, vibrant, joyful, high detail, 4k, cinematic lighting."
+        )
+
+    def image_url(self, formatted_prompt, seed=None, model=None, size=None):
+        # Create the API URL with the prompt and extra params
+        image_url = (
+            f"{self.api_url}{formatted_prompt}"
+            f"?model={model or self.model}&seed={self.seed if seed is None else seed}&nologo=true&enhance=true"
+        )
+        if size:
+            image_url += f"&width={size[0]}&height={size[1]}"
+        return image_url
+
+    def _fetch(self, image_url, model, report, cancelled):
+        """
+        Request one image and download it, holding one of the model's process-wide upstream slots.
+
+        :param cancelled: Callable returning True once the image is no longer wanted.
+        :return: The image bytes, or None if cancelled.
+        :raises DeadlineExceeded: If the basket deadline passes while waiting or downloading.
+        :raises: On HTTP errors and timeouts.
+        """
+        with _SLOTS_LOCK:
+            slots = _UPSTREAM_SLOTS.setdefault(model, threading.BoundedSemaphore(MAX_CONCURRENT))
+        started = time.monotonic()
+        while not slots.acquire(timeout=0.5):
+            if cancelled():
+                return None
+            budget = current_deadline()
+            if budget is not None and budget.expired():
+                raise DeadlineExceeded("pollinations")
+        try:
+            # Make the request; headers arrive once the image is generated
+            report("generate")
+            with span("pollinations.generate", model=model,
+                      slot_wait_ms=round((time.monotonic() - started) * 1000, 1)) as stage:
+                # turbo answers in a fraction of flux's time; keep their hedge delays apart.
+                # A hedged duplicate needs a free slot too, so the limit holds for every request
+                response = get_http_client().get(image_url, "pollinations", hedge=self.hedge, retries=1,
+                                                 hedge_slots=slots, latency_key=f"pollinations:{model}",
+                                                 stream=True)
+                stage.set(status=response.status_code)
+                if response.status_code != 200:
+                    stage.fail(f"HTTP {response.status_code}")
+            with response:
+                if response.status_code != 200:
+                    raise RuntimeError(response.status_code)
+
+                total = int(response.headers.get("Content-Length") or 0)
+                received = 0
+                chunks = []
+                report("download", 0.0 if total else None)
+                timed_out = False
+                with span("pollinations.download") as stage:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if cancelled():
+                            stage.fail("cancelled", outcome="cancelled")
+                            return None
+                        budget = current_deadline()
+                        if budget is not None and budget.expired():
+                            stage.fail("basket deadline passed", outcome="timeout")
+                            timed_out = True
+                            break
+                        chunks.append(chunk)
+                        received += len(chunk)
+                        stage.add_bytes_in(len(chunk))
+                        report("download", min(1.0, received / total) if total else None)
+                # Raised outside the span, which keeps its "timeout" outcome
+                if timed_out:
+                    raise DeadlineExceeded("pollinations")
+            return b"".join(chunks)
+        finally:
+            slots.release()
+
+    def generate_image(self, prompt, progress=None, cancel_event=None, seed=None, model=None):
         """
         Generate an image using Pollinations API
+
+        :param progress: Optional callback(stage, fraction) called as the request moves
+                         through "translate", "generate" and "download"; fraction is the
+                         share of the download received (None when unknown).
+        :param cancel_event: Optional threading.Event; the download stops once it is set.
+        :param seed: Defaults to self.seed.
+        :param model: "flux" or "turbo"; defaults to self.model.
+        :return: Tuple of (image_url, image_bytes), or None on failure.
+                 The bytes are the image exactly as served, so callers never
+                 need to request the URL a second time.
         """
+        report = progress or (lambda stage, fraction=None: None)
         try:
-            # Translate each item to English and emphasize visibility
-            items = [item.strip() for item in prompt.split(',') if item.strip()]
-            items_en = []
-            for item in items:
-                try:
-                    translated = GoogleTranslator(source='auto', target='en').translate(item)
-                except Exception:
-                    translated = item  # fallback
-                items_en.append(f"{translated} (clearly visible, in the front)")
-            items_english = ', '.join(items_en)
-            
-            # Build the improved prompt
-            formatted_prompt = (
-                f"A beautiful Shavuot basket on a festive table, containing: {items_english}. "
-                "The basket is overflowing, ultra-realistic, vibrant, joyful, high detail, 4k, cinematic lighting."
-            )
-            # print(formatted_prompt)
-            # Create the API URL with the prompt and extra params
-            image_url = (
-                f"{self.api_url}{formatted_prompt}"
-                f"?model=flux&seed=99&nologo=true&enhance=true"
-            )
-            
-            # Make the request
-            response = requests.get(image_url)
-            
-            if response.status_code == 200:
-                return image_url
-            else:
-                st.error(f"שגיאה ביצירת התמונה: {response.status_code}")
+            report("translate")
+            image_url = self.image_url(self.build_prompt(prompt), seed, model)
+            image_bytes = self._fetch(image_url, model or self.model, report,
+                                      lambda: cancel_event is not None and cancel_event.is_set())
+            if image_bytes is None:
                 return None
-                
+            return image_url, image_bytes
+
         except Exception as e:
             st.error(f"שגיאה ביצירת התמונה: {str(e)}")
             return None
 
+    def generate_draft(self, prompt, size=(512, 512), cancel_event=None):
+        """
+        Start a quick low-resolution turbo image of the basket, with the same
+        seed as the final one, on a background thread.
+
+        :param size: (width, height) of the draft.
+        :param cancel_event: Optional threading.Event; the draft stops once it is set.
+        :return: Future resolving to (image_url, image_bytes), or to None if the
+                 draft failed or was cancelled; failures are never shown to the user.
+        """
+        def draft():
+            try:
+                image_url = self.image_url(self.build_prompt(prompt), model="turbo", size=size)
+                image_bytes = self._fetch(image_url, "turbo", lambda stage, fraction=None: None,
+                                          lambda: cancel_event is not None and cancel_event.is_set())
+                return (image_url, image_bytes) if image_bytes else None
+            except Exception as e:
+                print(f"Draft image failed: {str(e)}")
+                return None
+
+        # Copy the context so the draft keeps the basket deadline and request id
+        return _VARIANT_EXECUTOR.submit(contextvars.copy_context().run, draft)
+
+    def generate_variants(self, prompt, seeds, model=None, cancel_event=None):
+        """
+        Generate several images of one basket, one per seed, concurrently.
+
+        The requests start right away, within the process-wide
+        POLLINATIONS_CONCURRENCY limit, and the items are translated once for
+        all of them. The seed self.seed gives the image generate_image returns.
+
+        :param seeds: One image per seed.
+        :param model: "flux" or "turbo"; defaults to self.model.
+        :param cancel_event: Optional threading.Event; variants still queued or
+                             downloading stop once it is set, or once the returned
+                             iterator is closed after iteration began (a generator
+                             closed before its first item never runs its cleanup).
+        :return: Iterator of (seed, image_url, image_bytes) in the order the images
+                 finish; url and bytes are None for a variant that failed.
+        """
+        closed = threading.Event()
+
+        def cancelled():
+            return closed.is_set() or (cancel_event is not None and cancel_event.is_set())
+
+        # Each task gets its own copy of the context: the basket deadline and request id
+        formatted_prompt = _VARIANT_EXECUTOR.submit(contextvars.copy_context().run, self.build_prompt, prompt)
+
+        def fetch(seed):
+            image_url = self.image_url(formatted_prompt.result(), seed, model)
+            return image_url, self._fetch(image_url, model or self.model, lambda stage, fraction=None: None,
+                                          cancelled)
+
+        futures = {_VARIANT_EXECUTOR.submit(contextvars.copy_context().run, fetch, seed): seed for seed in seeds}
+        return self._as_finished(futures, closed)
+
+    @staticmethod
+    def _as_finished(futures, closed):
+        try:
+            for future in as_completed(futures):
+                seed = futures[future]
+                try:
+                    image_url, image_bytes = future.result()
+                except Exception as e:
+                    print(f"Variant with seed {seed} failed: {str(e)}")
+                    image_url, image_bytes = None, None
+                yield seed, image_url if image_bytes else None, image_bytes
+        finally:
+            closed.set()
+            for future in futures:
+                future.cancel()
+
     @staticmethod
     def convert_image_url_to_base64(image_url):
         try:
-            response = requests.get(image_url)
+            response = get_http_client().get(image_url, "pollinations")
             response.raise_for_status()
             img = Image.open(io.BytesIO(response.content))
             buffered = io.BytesIO()
@@ -98,7 +262,10 @@ def test(upload_dir="uploads", model_name="turbo", filename=None):
     if not os.path.exists(upload_dir):
         os.makedirs(upload_dir)
 
-    image_url = generator.generate_image(prompt)
+    result = generator.generate_image(prompt)
+    if result is None:
+        return None
+    image_url, image_bytes = result
     return image_url
 
 if __name__ == "__main__":
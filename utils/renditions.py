@@ -0,0 +1,102 @@
+import io
+import threading
+from typing import Optional
+
+from PIL import Image
+
+from utils.tracing import span
+
+# One entry per destination. max_side=None keeps the full resolution.
+RENDITIONS = {
+    # Browser display: the page column is ~700px wide
+    "preview": {"format": "WEBP", "max_side": 720, "params": {"quality": 80, "method": 4}},
+    # Telegram recompresses photos to 1280px anyway; 10 MB hard limit
+    "telegram": {"format": "JPEG", "max_side": 1280, "params": {"quality": 85, "optimize": True, "progressive": True}},
+    # Imgur share link: full resolution, near-lossless
+    "share": {"format": "JPEG", "max_side": None, "params": {"quality": 92, "optimize": True}},
+    # Download: lossless master, also the cached source for the others
+    "download": {"format": "PNG", "max_side": None, "params": {"optimize": True}},
+}
+
+MIME_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg", "PNG": "png"}
+
+
+class Renditions:
+    """
+    Per-destination encodings of one finished basket image.
+
+    Each rendition is encoded only when first requested and then kept, in
+    memory and, when a cache and key are given, next to the basket in the
+    on-disk BasketCache so repeat baskets skip encoding altogether.
+    """
+
+    def __init__(self, image: Optional[Image.Image] = None, png_bytes: Optional[bytes] = None,
+                 cache=None, cache_key: Optional[str] = None):
+        if image is None and png_bytes is None:
+            raise ValueError("Renditions need an image or its PNG bytes")
+        self._image = image
+        self._encoded = {}
+        if png_bytes is not None:
+            self._encoded["download"] = png_bytes
+        self.cache = cache
+        self.cache_key = cache_key
+        self._lock = threading.Lock()
+
+    def attach_cache(self, cache, cache_key: str):
+        """
+        Cache the renditions encoded so far next to the basket, and every later one.
+
+        Used once a fresh composition has been shown and its entry written.
+        """
+        with self._lock:
+            self.cache, self.cache_key = cache, cache_key
+            encoded = dict(self._encoded)
+        for name, data in encoded.items():
+            if name != "download":  # the entry's final image
+                cache.put_rendition(cache_key, name, data)
+
+    @property
+    def image(self) -> Image.Image:
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self._encoded["download"])).convert("RGB")
+        return self._image
+
+    def get(self, name: str) -> bytes:
+        """
+        :param name: One of RENDITIONS.
+        :return: The encoded bytes for that destination.
+        """
+        with self._lock:
+            if name in self._encoded:
+                return self._encoded[name]
+            with span("rendition", rendition=name, format=RENDITIONS[name]["format"]) as stage:
+                data = None
+                if self.cache is not None and self.cache_key:
+                    data = self.cache.get_rendition(self.cache_key, name)
+                stage.set(cached=data is not None)
+                if data is None:
+                    data = self._encode(RENDITIONS[name])
+                    if self.cache is not None and self.cache_key:
+                        self.cache.put_rendition(self.cache_key, name, data)
+                stage.add_bytes_out(len(data))
+            self._encoded[name] = data
+            return data
+
+    def _encode(self, spec: dict) -> bytes:
+        img = self.image
+        max_side = spec["max_side"]
+        if max_side and max(img.size) > max_side:
+            img = img.copy()
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format=spec["format"], **spec["params"])
+        return buffer.getvalue()
+
+    @staticmethod
+    def mime_type(name: str) -> str:
+        return MIME_TYPES[RENDITIONS[name]["format"]]
+
+    @staticmethod
+    def filename(name: str, stem: str = "bikkurim_basket") -> str:
+        return f"{stem}.{EXTENSIONS[RENDITIONS[name]['format']]}"
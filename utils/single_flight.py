@@ -0,0 +1,84 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # The leader was interrupted (e.g. a Streamlit rerun) rather than failing
+        self.abandoned = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait for and share its result instead
+    of repeating the work. Once the call finishes the key is forgotten, so a
+    later call runs again (pair this with a cache for long-lived reuse).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` once per in-flight key.
+
+        Only an Exception from the leader is shared. Anything else (Streamlit's
+        rerun and stop signals, KeyboardInterrupt) belongs to the leader's own
+        thread, so the waiting callers are woken instead and one of them runs
+        the function as the new leader.
+
+        :return: The leader's result, shared by every caller with the same key.
+        :raises: Whatever Exception the leader's call raised, in every waiting caller.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    call.waiters += 1
+                    self.coalesced += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    self.executed += 1
+                    leader = True
+
+            if leader:
+                break
+            call.done.wait()
+            if call.abandoned:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """Counters: calls that ran, calls that shared another's result, keys in flight."""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,193 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from utils.TelegramSender import TelegramSender, TelegramRateLimited
+from utils.tracing import span, current_request_id
+
+MAX_MEDIA_GROUP = 10  # Telegram's sendMediaGroup limit
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, tokens: float = 1):
+        """
+        Wait until `tokens` can be taken. A request larger than the burst waits
+        for a full bucket and leaves it in debt, so the average rate still holds.
+        """
+        needed = min(tokens, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= needed:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((needed - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Empty the bucket for `seconds`, e.g. after a 429 with retry_after."""
+        self.tokens = -seconds * self.rate
+        self.updated = time.monotonic()
+
+
+class _Delivery:
+    def __init__(self, photo_bytes, caption, filename, content_type):
+        self.photo = (photo_bytes, filename, content_type, caption)
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.request_id = current_request_id()
+
+
+class TelegramDispatcher:
+    """
+    Rate-aware delivery of basket photos to the Telegram chat.
+
+    Runs the async TelegramSender, with its shared aiohttp session, on a
+    private event loop in a background thread. Photos that arrive within
+    `linger` seconds of each other are sent as one sendMediaGroup album of
+    up to 10, and every request first takes a token per photo from a bucket
+    sized to Telegram's per-chat limit (20 messages a minute in groups; each
+    photo of an album is one message). A 429 pauses the bucket for the
+    server's retry_after and the batch is retried.
+    """
+
+    def __init__(self, sender: Optional[TelegramSender] = None, rate_per_minute: float = 20,
+                 burst: int = 3, linger: float = 1.5, max_queue: int = 1000, max_attempts: int = 5):
+        self.sender = sender or TelegramSender()
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.linger = linger
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run_loop, name="telegram-dispatcher", daemon=True)
+        self._ready = threading.Event()
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rate_limited = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        if not self._thread.is_alive():
+            self._thread.start()
+            self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._ready.set()
+        self._loop.run_until_complete(self._drain())
+
+    def submit(self, photo_bytes: bytes, caption: Optional[str] = None,
+               filename: str = "bikkurim_basket.jpg", content_type: str = "image/jpeg") -> Future:
+        """
+        Queue a photo for delivery; thread-safe and non-blocking.
+
+        :return: Future resolving to True once Telegram accepted the photo, or
+                 failing if it was dropped (queue full or out of attempts).
+        """
+        delivery = _Delivery(photo_bytes, caption, filename, content_type)
+        with self._lock:
+            self.queued += 1
+        self._loop.call_soon_threadsafe(self._put, delivery)
+        return delivery.future
+
+    def _put(self, delivery: _Delivery):
+        try:
+            self._queue.put_nowait(delivery)
+        except asyncio.QueueFull:
+            self._drop([delivery], "queue full")
+
+    async def _drain(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.linger
+            while len(batch) < MAX_MEDIA_GROUP:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._send(batch)
+
+    async def _send(self, batch):
+        with span("telegram.send", photos=len(batch),
+                  request_ids=[d.request_id for d in batch if d.request_id]) as stage:
+            while batch:
+                await self.bucket.acquire(len(batch))
+                if batch[0].attempts:
+                    stage.add_retry()
+                for delivery in batch:
+                    delivery.attempts += 1
+                    stage.add_bytes_out(len(delivery.photo[0]))
+                try:
+                    if len(batch) == 1:
+                        photo_bytes, filename, content_type, caption = batch[0].photo
+                        result = await self.sender.send_photo_bytes(photo_bytes, caption, filename=filename,
+                                                                    content_type=content_type)
+                    else:
+                        result = await self.sender.send_media_group([d.photo for d in batch])
+                except TelegramRateLimited as e:
+                    with self._lock:
+                        self.rate_limited += 1
+                    self.bucket.pause(e.retry_after)
+                    result = None
+                if result:
+                    self._delivered(batch)
+                    return
+                exhausted = [d for d in batch if d.attempts >= self.max_attempts]
+                if exhausted:
+                    self._drop(exhausted, "too many failed attempts")
+                    stage.fail(f"dropped {len(exhausted)} photo(s)")
+                batch = [d for d in batch if d.attempts < self.max_attempts]
+
+    def _delivered(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.sent += len(batch)
+            for delivery in batch:
+                latency = now - delivery.enqueued_at
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+        for delivery in batch:
+            delivery.future.set_result(True)
+
+    def _drop(self, deliveries, reason: str):
+        with self._lock:
+            self.dropped += len(deliveries)
+        print(f"Dropped {len(deliveries)} Telegram photo(s): {reason}")
+        for delivery in deliveries:
+            delivery.future.set_exception(RuntimeError(f"Telegram delivery dropped: {reason}"))
+
+    def metrics(self) -> dict:
+        """Delivery counters and enqueue-to-sent latency in seconds."""
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "pending": self.queued - self.sent - self.dropped,
+                "batches": self.batches,
+                "rate_limited": self.rate_limited,
+                "queue_latency_avg": self._latency_total / self.sent if self.sent else 0.0,
+                "queue_latency_max": self._latency_max,
+            }
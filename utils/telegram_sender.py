@@ -1,7 +1,8 @@
 import os
-import requests
 from dotenv import load_dotenv
 
+from utils.http_client import get_http_client
+
 class TelegramSender:
     def __init__(self, bot_token: str = None, chat_id: str = None):
         load_dotenv()
@@ -13,27 +14,31 @@ class TelegramSender:
         if not self.chat_id:
             raise ValueError("Telegram Chat ID not found. Please provide it or set it in the environment variables.")
             
-        self.api_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.api_url = f"{os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')}/bot{self.bot_token}"
 
-    def send_photo_bytes(self, photo_bytes: bytes, caption: str = "Bikkurim Basket") -> bool:
+    def send_photo_bytes(self, photo_bytes: bytes, caption: str = "Bikkurim Basket",
+                         filename: str = "bikkurim_basket.png", mime_type: str = "image/png") -> bool:
         """
         Sends photo bytes to Telegram using the bot API.
         
         :param photo_bytes: The photo data in bytes
         :param caption: Optional caption for the photo
+        :param filename: File name reported to Telegram
+        :param mime_type: Content type of photo_bytes
         :return: True if successful, False otherwise
         """
         try:
             url = f"{self.api_url}/sendPhoto"
             files = {
-                'photo': ('bikkurim_basket.png', photo_bytes, 'image/png')
+                'photo': (filename, photo_bytes, mime_type)
             }
             data = {
                 'chat_id': self.chat_id,
                 'caption': caption
             }
             
-            response = requests.post(url, files=files, data=data)
+            # No retries: a photo whose answer was lost may already be in the chat
+            response = get_http_client().request("POST", url, "telegram", retries=0, files=files, data=data)
             response.raise_for_status()
             return True
             
@@ -66,7 +71,7 @@ class TelegramSender:
                 'text': message
             }
             
-            response = requests.post(url, data=data)
+            response = get_http_client().request("POST", url, "telegram", retries=0, data=data)
             response.raise_for_status()
             return True
             
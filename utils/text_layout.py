@@ -0,0 +1,94 @@
+from functools import lru_cache
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+BLESSING_FONTS = ("NotoSansHebrew-Regular.ttf", "arial.ttf")
+TIPS_FONTS = ("arial.ttf",)
+LINE_SPACING = 10
+
+
+@lru_cache(maxsize=16)
+def load_font(candidates: Tuple[str, ...], size: int):
+    """
+    Load the first available TrueType font, falling back to Pillow's default.
+    Cached per (candidates, size), so each font file is read from disk once.
+    """
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=8192)
+def _text_width(font, text: str) -> float:
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=8192)
+def _text_height(font, text: str) -> int:
+    left, top, right, bottom = font.getbbox(text)
+    return bottom - top
+
+
+def wrap_words(words: List[str], font, max_width: int) -> List[str]:
+    """
+    Greedy word wrap in one pass: each word is measured once (and cached
+    across calls) and line widths are summed instead of re-measuring the
+    growing line.
+    """
+    space = _text_width(font, " ")
+    lines = []
+    current = []
+    current_width = 0.0
+    for word in words:
+        word_width = _text_width(font, word)
+        new_width = word_width if not current else current_width + space + word_width
+        if new_width <= max_width or not current:
+            current.append(word)
+            current_width = new_width
+        else:
+            lines.append(" ".join(current))
+            current = [word]
+            current_width = word_width
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+
+@lru_cache(maxsize=64)
+def render_text_block(text: str, font, width: int, fill: str = "black") -> Tuple[Image.Image, int]:
+    """
+    Render Hebrew text wrapped and centered into a transparent RGBA tile.
+
+    Results are cached by (text, font, width); the returned tile is shared,
+    so callers must paste it rather than draw on it.
+
+    :return: (tile, block_height) where block_height is the layout height of
+             the wrapped lines; the tile is a little taller so descenders of
+             the last line are not clipped.
+    """
+    # --- RTL Hebrew fix ---
+    # Imported here so pages that never render a blessing don't load them
+    import arabic_reshaper
+    from bidi.algorithm import get_display
+    bidi_text = get_display(arabic_reshaper.reshape(text))
+    max_width = width - 40  # 20px padding each side
+    lines = wrap_words(bidi_text.split(), font, max_width)
+    # Reverse lines for correct Hebrew (RTL) order
+    lines = lines[::-1]
+    if not lines:
+        return Image.new("RGBA", (width, 1), (0, 0, 0, 0)), 0
+
+    line_height = max(_text_height(font, line) for line in lines)
+    block_height = line_height * len(lines) + LINE_SPACING * (len(lines) - 1)
+    _, descent = font.getmetrics() if hasattr(font, "getmetrics") else (0, 0)
+    tile = Image.new("RGBA", (width, block_height + descent), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    y = 0
+    for line in lines:
+        draw.text((width // 2, y), line, fill=fill, font=font, anchor="ma")
+        y += line_height + LINE_SPACING
+    return tile, block_height
@@ -1,44 +1,123 @@
-from together import Together
 import os
 from dotenv import load_dotenv
+import re
+import time
 import streamlit as st
 
+from utils.tracing import span
+from utils.http_client import breaker, time_left
+
+# A one-sentence blessing is ~20-40 Hebrew tokens; the cap only guards against run-ons
+MAX_TOKENS = 120
+# End of the first sentence: terminal punctuation, optionally followed by closing quotes/emoji
+SENTENCE_END = re.compile(r'[.!?…]["\'״”)\s]*$')
+
 class TogetherAIGenerator:
-    def __init__(self):
+    def __init__(self, timeout: float = 60):
         load_dotenv()
         self.api_key = os.getenv("TOGETHER_API_KEY")
         self.model = "meta-llama/Llama-3.3-70B-Instruct-Turbo-Free"  # or "meta-llama/Llama-3-8B-Instruct"
-        self.client = Together(api_key=self.api_key)
+        # The SDK (httpx + pydantic models) takes ~0.3s to import; pay it on first use, not at startup
+        from together import Together
+        self.timeout = timeout
+        self.client = Together(api_key=self.api_key, timeout=timeout)
 
-    def generate_hebrew_text(self, prompt):
-        """
-        Generate Hebrew text using Together AI's Llama-3 model (chat endpoint)
-        """
+    def _messages(self, prompt):
+        system_prompt = (
+            "אתה משורר עברי מודרני. כתוב משפט קצר, משעשע ומקורי על סל ביכורים. "
+            "השתמש בשפה עברית יפה ומודרנית."
+        )
+        user_prompt = f"כתוב משפט על סל ביכורים שמכיל: {prompt}"
+        # print(f"user_prompt: {user_prompt}")    
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+
+    def _create(self, messages, stream):
+        """Chat completion under the "together" circuit breaker, timed out by the basket deadline"""
+        circuit = breaker("together")
+        timeout = time_left("together", self.timeout)
+        trial = circuit.before_call()
         try:
-            system_prompt = (
-                "אתה משורר עברי מודרני. כתוב משפט קצר, משעשע ומקורי על סל ביכורים. "
-                "השתמש בשפה עברית יפה ומודרנית."
-            )
-            user_prompt = f"כתוב משפט על סל ביכורים שמכיל: {prompt}"
-            # print(f"user_prompt: {user_prompt}")    
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=2000,
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                stop=["\n"],
                 temperature=0.7,
-                stream=False
+                stream=stream,
+                timeout=timeout,
             )
-            # Extract the generated text
-            generated_text = response.choices[0].message.content.strip()
+        except Exception as e:
+            # Rejected requests (4xx, e.g. rate limits) don't mean the service is down
+            if getattr(e, "status_code", 500) >= 500:
+                circuit.record_failure()
+            raise
+        else:
+            circuit.record_success()
+        finally:
+            circuit.release(trial)
+        return response
+
+    def generate_hebrew_text(self, prompt):
+        """
+        Generate Hebrew text using Together AI's Llama-3 model (chat endpoint)
+        """
+        try:
+            with span("llm.generate", model=self.model) as stage:
+                messages = self._messages(prompt)
+                stage.add_bytes_out(sum(len(m["content"].encode("utf-8")) for m in messages))
+                response = self._create(messages, stream=False)
+                # Extract the generated text
+                generated_text = response.choices[0].message.content.strip()
+                stage.add_bytes_in(len(generated_text.encode("utf-8")))
             return generated_text
 
         except Exception as e:
             st.error(f"שגיאה ביצירת הטקסט: {str(e)}")
             return None
 
+    def stream_hebrew_text(self, prompt):
+        """
+        Stream the blessing as it is generated, for st.write_stream.
+
+        Yields text fragments and stops at the end of the first sentence (or
+        line), closing the connection instead of waiting for the model.
+        """
+        try:
+            with span("llm.stream", model=self.model) as stage:
+                messages = self._messages(prompt)
+                stage.add_bytes_out(sum(len(m["content"].encode("utf-8")) for m in messages))
+                stream = self._create(messages, stream=True)
+                try:
+                    text = ""
+                    for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        piece = chunk.choices[0].delta.content or ""
+                        if not text:
+                            piece = piece.lstrip()
+                            if piece:
+                                stage.set(first_token_ms=round((time.perf_counter() - stage.started) * 1000, 1))
+                        if "\n" in piece:
+                            piece = piece.split("\n", 1)[0]
+                            text += piece
+                            yield piece
+                            break
+                        if not piece:
+                            continue
+                        text += piece
+                        yield piece
+                        if SENTENCE_END.search(text):
+                            break
+                finally:
+                    stream.close()
+                    stage.add_bytes_in(len(text.encode("utf-8")))
+
+        except Exception as e:
+            st.error(f"שגיאה ביצירת הטקסט: {str(e)}")
+
 def test():
     generator = TogetherAIGenerator()
     test_prompt = "תפוחים, דבש, ואהבה"
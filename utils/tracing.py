@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+# Session and basket the current code runs on behalf of; copied into worker
+# threads with contextvars.copy_context()
+_user_id: ContextVar[Optional[str]] = ContextVar("user_id", default=None)
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_logger = logging.getLogger("bikkurim.trace")
+if not _logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _logger.addHandler(_handler)
+    _logger.propagate = False
+    _logger.setLevel(logging.INFO if os.getenv("TRACE_LOG", "1") != "0" else logging.WARNING)
+
+
+def current_user_id() -> Optional[str]:
+    return _user_id.get()
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_span() -> Optional["Span"]:
+    """The innermost open span, for library code that reports retries or attributes into it."""
+    return _current_span.get()
+
+
+@contextmanager
+def request_context(user_id: Optional[str], request_id: Optional[str] = None):
+    """
+    Attribute every span inside the block to this session and request.
+
+    :param request_id: Defaults to a new id prefixed with the user id, so all
+                       requests of one session can be found together.
+    :return: The request id.
+    """
+    if request_id is None:
+        request_id = f"{(user_id or 'anon')[:8]}-{uuid.uuid4().hex[:8]}"
+    user_token = _user_id.set(user_id)
+    request_token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _reset(_request_id, request_token)
+        _reset(_user_id, user_token)
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        pass  # a generator closed from another context; nothing to restore there
+
+
+class Span:
+    """One timed unit of work; filled in by the code inside the span() block."""
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.parent = _current_span.get()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.outcome = "ok"
+        self.error = None
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add_bytes_in(self, count: int):
+        self.bytes_in += count
+
+    def add_bytes_out(self, count: int):
+        self.bytes_out += count
+
+    def add_retry(self):
+        self.retries += 1
+
+    def fail(self, error, outcome: str = "error"):
+        """Mark the span failed without raising, for code that reports errors by return value."""
+        self.outcome = outcome
+        self.error = str(error)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a pipeline stage and export it as a JSON log line and as metrics.
+
+    Exceptions mark the span as failed and propagate; code that signals
+    failure by returning None calls span.fail() instead.
+    """
+    current = Span(name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except GeneratorExit:
+        current.fail("closed by the consumer", outcome="cancelled")
+        raise
+    except BaseException as e:
+        current.fail(str(e) or type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.started
+        _reset(_current_span, token)
+        _record(current)
+
+
+def _record(current: Span):
+    labels = {"stage": current.name}
+    METRICS.observe("bikkurim_stage_duration_seconds", dict(labels, outcome=current.outcome), current.duration)
+    if current.bytes_in:
+        METRICS.inc("bikkurim_stage_bytes_in_total", labels, current.bytes_in)
+    if current.bytes_out:
+        METRICS.inc("bikkurim_stage_bytes_out_total", labels, current.bytes_out)
+    if current.retries:
+        METRICS.inc("bikkurim_stage_retries_total", labels, current.retries)
+
+    if not _logger.isEnabledFor(logging.INFO):
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "span": current.name,
+        "parent": current.parent.name if current.parent else None,
+        "request_id": _request_id.get(),
+        "user_id": _user_id.get(),
+        "duration_ms": round(current.duration * 1000, 1),
+        "outcome": current.outcome,
+    }
+    for field in ("bytes_in", "bytes_out", "retries"):
+        if getattr(current, field):
+            entry[field] = getattr(current, field)
+    if current.error:
+        entry["error"] = current.error
+    entry.update(current.attrs)
+    _logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class Metrics:
+    """
+    In-process counters and histograms, rendered in the Prometheus text format.
+
+    Collectors are callables returning a dict of numbers, read at scrape time,
+    for components that already keep their own counters.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, list] = {}  # bucket counts..., sum, count
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float):
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def register_collector(self, prefix: str, collect: Callable[[], dict]):
+        """Expose collect()'s numeric values as gauges named bikkurim_<prefix>_<key>."""
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    @staticmethod
+    def _labels(labels, extra=()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+            collectors = dict(self._collectors)
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{self._labels(labels)} {value:g}")
+        for (name, labels), series in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {series[-2]:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {series[-1]}")
+        for prefix, collect in sorted(collectors.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {str(e)}")
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"bikkurim_{prefix}_{key}"
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9464) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve METRICS at http://host:port/metrics from a daemon thread.
+
+    :return: The server, or None if the port is taken (e.g. by another app process).
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on {host}:{port}: {str(e)}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
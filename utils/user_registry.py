@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import threading
+
+
+class UserRegistry:
+    """
+    Unique-user registry backed by SQLite in WAL mode.
+
+    Membership is a primary-key lookup and the total is kept in a counter
+    row updated in the same transaction as the insert, so registering a
+    user costs the same however many users exist. SQLite's locking makes
+    writes safe across threads and processes. Users from the legacy
+    users.txt file are imported once on first use.
+    """
+
+    def __init__(self, db_path: str = "users.db", legacy_file: str = "users.txt"):
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        self._local = threading.local()
+        self._setup()
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _setup(self):
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('user_count', 0)")
+            migrated = conn.execute("SELECT value FROM meta WHERE key = 'legacy_migrated'").fetchone()
+            if not migrated and os.path.exists(self.legacy_file):
+                with open(self.legacy_file) as f:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO users (user_id) VALUES (?)",
+                        ((line.strip(),) for line in f if line.strip()),
+                    )
+                conn.execute("UPDATE meta SET value = (SELECT COUNT(*) FROM users) WHERE key = 'user_count'")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', 1)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def register(self, user_id: str) -> int:
+        """
+        Record a user if not seen before.
+
+        :param user_id: The session's user id.
+        :return: Total number of unique users.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,)).rowcount
+            if inserted:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'user_count'")
+            total = conn.execute("SELECT value FROM meta WHERE key = 'user_count'").fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return total
+
+    def count(self) -> int:
+        """Total number of unique users, read from the counter row."""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'user_count'").fetchone()[0]
+
+    def __contains__(self, user_id: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone() is not None